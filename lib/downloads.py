@@ -0,0 +1,469 @@
+import hashlib
+import http
+import http.client
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+# downloads of large files that can be continued after an interruption, split into concurrent range requests and
+# hashed as they are written. Nothing here depends on spack, the fetchers pass in an open_url that uses spack's
+# configuration
+
+logger = logging.getLogger(__name__)
+
+RequestInfo = namedtuple('RequestInfo', 'url timeout cafile capath context'.split())
+
+# the headers of a finished download and the hex digest of the file computed as it was written [None if not requested]
+DownloadResult = namedtuple('DownloadResult', 'headers digest'.split())
+
+# socket timeout while a file is being downloaded, large licensed archives can stall for a long time
+DOWNLOAD_TIMEOUT = 1000000
+
+# downloads are read in blocks of this size and an interrupted download is resumed this many times
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+
+# seconds before the first retry of a failed download, each later retry waits twice as long up to the maximum
+DOWNLOAD_BACKOFF = 1.0
+DOWNLOAD_MAX_BACKOFF = 60.0
+
+# files with segments smaller than this are downloaded with a single stream
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    """a download failed, code is the HTTP status if the server replied with an error"""
+
+    def __init__(self, msg, code=None):
+        super(DownloadError, self).__init__(msg)
+        self.code = code
+
+
+def open_url(url, request_modifier=None, timeout=DOWNLOAD_TIMEOUT):
+    """open url with urllib after request_modifier has modified the request, returns the url that was finally opened,
+    the response headers and the response"""
+
+    request_info = RequestInfo(Request(url), timeout, None, None, None)
+    if request_modifier is not None:
+        request_info = request_modifier(request_info.url, timeout)
+
+    try:
+        response = urlopen(request_info.url, timeout=request_info.timeout, context=request_info.context)
+    except HTTPError as e:
+        raise DownloadError(f'Download failed: {url} [HTTP Error {e.code}]', e.code) from e
+    except (URLError, OSError) as e:
+        raise DownloadError(f'Download failed: {url} because {e}') from e
+
+    return response.geturl(), response.headers, response
+
+
+class RangeRequestModifier:
+    """request the part of a file from offset onwards [up to and including end if it is given], other modifications
+    are made by the wrapped request modifier"""
+
+    def __init__(self, offset, request_modifier=None, end=None):
+        self._offset = offset
+        self._request_modifier = request_modifier
+        self._end = end
+
+    def __call__(self, url, timeout, cafile=None, capath=None, context=None) -> RequestInfo:
+
+        if self._request_modifier is not None:
+            result = self._request_modifier(url, timeout, cafile=cafile, capath=capath, context=context)
+        else:
+            result = RequestInfo(url, timeout, cafile, capath, context)
+
+        request = result.url if isinstance(result.url, Request) else Request(result.url)
+        if self._offset or self._end is not None:
+            end = self._end if self._end is not None else ''
+            request.add_header('Range', f'bytes={self._offset}-{end}')
+
+        return result._replace(url=request)
+
+
+class TerminalProgress:
+    """a progress bar for a download written to the terminal, like the one curl shows with -#"""
+
+    WIDTH = 50
+
+    def __init__(self, stream=None):
+        self._stream = sys.stdout if stream is None else stream
+        self._last_text = None
+
+    def __call__(self, url, bytes_done, total_bytes):
+        if total_bytes:
+            done = min(bytes_done, total_bytes) * self.WIDTH // total_bytes
+            text = f'{"#" * done}{" " * (self.WIDTH - done)} {bytes_done * 100 // total_bytes:3d}%'
+        else:
+            text = f'{bytes_done // 1024} KiB'
+
+        if text != self._last_text:
+            self._stream.write(f'\r{text}')
+            if total_bytes and bytes_done >= total_bytes:
+                self._stream.write('\n')
+            self._stream.flush()
+            self._last_text = text
+
+
+def get_total_size(headers, offset=0):
+    """the size of the whole file from a Content-Range or Content-Length header, None if it isn't known"""
+
+    result = None
+
+    content_range = headers.get('Content-Range')
+    content_length = headers.get('Content-Length')
+
+    if content_range and content_range.rsplit('/', 1)[-1].isdigit():
+        result = int(content_range.rsplit('/', 1)[-1])
+    elif content_length and content_length.isdigit():
+        result = offset + int(content_length)
+
+    return result
+
+
+class CountingDigest:
+    """a digest of the bytes at the start of a file that knows how many bytes it has seen"""
+
+    def __init__(self, algorithm):
+        self._digest = hashlib.new(algorithm)
+        self.size = 0
+
+    @classmethod
+    def from_file(cls, file_name, algorithm, buffer_size=DOWNLOAD_BUFFER_SIZE):
+        result = cls(algorithm)
+        with open(file_name, 'rb') as file_handle:
+            for data in iter(lambda: file_handle.read(buffer_size), b''):
+                result.update(data)
+        return result
+
+    def update(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class OrderedFileDigest:
+    """the digest of a file that is written as several segments at once, the bytes are hashed in file order as soon
+    as they and all the bytes before them have been written, so they are read back while still in the page cache"""
+
+    def __init__(self, file_name, segments, algorithm, buffer_size=DOWNLOAD_BUFFER_SIZE):
+        self._digest = hashlib.new(algorithm)
+        self._segments = segments
+        self._written = [start for start, _ in segments]
+        self._current = 0
+        self._position = 0
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._file_descriptor = os.open(file_name, os.O_RDONLY)
+
+    def written(self, index, position):
+        """segment index has been written up to position"""
+
+        with self._lock:
+            self._written[index] = position
+
+            while self._current < len(self._segments):
+                while self._position < self._written[self._current]:
+                    length = min(self._buffer_size, self._written[self._current] - self._position)
+                    data = os.pread(self._file_descriptor, length, self._position)
+                    self._digest.update(data)
+                    self._position += len(data)
+
+                if self._position < self._segments[self._current][1]:
+                    break
+                self._current += 1
+
+    def hexdigest(self):
+        if self._current < len(self._segments):
+            raise ValueError('the digest of a file is only available once all its segments have been written')
+        return self._digest.hexdigest()
+
+    def close(self):
+        os.close(self._file_descriptor)
+
+
+class FollowingFileDigest(threading.Thread):
+    """hash a file while another process, e.g. curl, writes it by following the end of the file as it grows like
+    tail -f, so the bytes are read back while they are still in the page cache"""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, file_name, algorithm, buffer_size=DOWNLOAD_BUFFER_SIZE):
+        super(FollowingFileDigest, self).__init__(daemon=True)
+
+        self._file_name = file_name
+        self._digest = CountingDigest(algorithm)
+        self._buffer_size = buffer_size
+        self._finished = threading.Event()
+        self._error = None
+
+    def run(self):
+        try:
+            while not os.path.exists(self._file_name):
+                if self._finished.wait(self.POLL_INTERVAL):
+                    return
+
+            with open(self._file_name, 'rb') as file_handle:
+                while True:
+                    # check before reading so the last read happens after the writer has finished
+                    finished = self._finished.is_set()
+
+                    data = file_handle.read(self._buffer_size)
+                    if data:
+                        self._digest.update(data)
+                    elif finished:
+                        break
+                    else:
+                        self._finished.wait(self.POLL_INTERVAL)
+        except OSError as e:
+            self._error = e
+
+    def finish(self):
+        """call once the writer has finished, the digest of the whole file or None if it couldn't be read"""
+
+        self._finished.set()
+        self.join()
+
+        result = None
+        if self._error is None and os.path.exists(self._file_name) \
+                and self._digest.size == os.path.getsize(self._file_name):
+            result = self._digest.hexdigest()
+
+        return result
+
+
+def is_transient_error(error):
+    """true if a request that failed with error may succeed if it is tried again"""
+    code = getattr(error, 'code', None)
+    return code is None or code >= http.HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+def _copy_with_progress(url, response, file_handle, offset, total_bytes, buffer_size, progress_callbacks,
+                        digest=None):
+
+    bytes_done = offset
+    while True:
+        data = response.read(buffer_size)
+        if not data:
+            break
+
+        file_handle.write(data)
+        if digest is not None:
+            digest.update(data)
+        bytes_done += len(data)
+
+        for callback in progress_callbacks:
+            callback(url, bytes_done, total_bytes)
+
+    if total_bytes is not None and bytes_done < total_bytes:
+        raise http.client.IncompleteRead(b'', total_bytes - bytes_done)
+
+
+def retry_delay(attempt):
+    """seconds to wait before retry number attempt, an exponential backoff with jitter so a struggling server isn't
+    sent every retry in a burst and downloads that failed together don't all retry together"""
+
+    delay = min(DOWNLOAD_BACKOFF * 2 ** (attempt - 1), DOWNLOAD_MAX_BACKOFF)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def download_to_file(url, partial_file, request_modifier=None, buffer_size=DOWNLOAD_BUFFER_SIZE,
+                     retries=DOWNLOAD_RETRIES, progress_callbacks=(), hash_algorithm=None, open_url=open_url):
+    """download url into partial_file, the download continues from the end of an existing partial file if the server
+    supports range requests and an interrupted download is resumed up to retries times. If hash_algorithm is given the
+    digest of the file is computed as it is written. open_url opens each request, see open_url below"""
+
+    digest = None
+    attempt = 0
+    while True:
+        offset = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+
+        try:
+            _, headers, response = open_url(url, request_modifier=RangeRequestModifier(offset, request_modifier))
+        except DownloadError as e:
+            if offset and e.code == http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                # the partial file can't be continued, so start from the beginning
+                logger.debug(f'discarding partial download {partial_file} of {url}')
+                os.remove(partial_file)
+                continue
+
+            # keep the partial file and try again if the error may go away [a dropped connection or a server error]
+            attempt += 1
+            if not is_transient_error(e) or attempt > retries:
+                raise
+
+            logger.warning(f'request for {url} failed, trying again [{e}]')
+            time.sleep(retry_delay(attempt))
+            continue
+
+        if offset and response.getcode() != http.HTTPStatus.PARTIAL_CONTENT:
+            logger.debug(f"server for {url} doesn't support range requests, restarting download")
+            offset = 0
+
+        if hash_algorithm and not offset:
+            digest = CountingDigest(hash_algorithm)
+        elif hash_algorithm and (digest is None or digest.size != offset):
+            digest = CountingDigest.from_file(partial_file, hash_algorithm, buffer_size)
+
+        try:
+            with open(partial_file, 'ab' if offset else 'wb') as file_handle:
+                _copy_with_progress(url, response, file_handle, offset, get_total_size(headers, offset), buffer_size,
+                                    progress_callbacks, digest)
+            break
+        except (http.client.HTTPException, OSError) as e:
+            attempt += 1
+            if attempt > retries:
+                raise DownloadError(f'Download failed: {url} was interrupted {attempt} times, last error {e!r}')
+
+            logger.warning(f'download of {url} interrupted after {os.path.getsize(partial_file)} bytes, resuming [{e!r}]')
+        finally:
+            response.close()
+
+        time.sleep(retry_delay(attempt))
+
+    return DownloadResult(headers, digest.hexdigest() if digest is not None else None)
+
+
+def split_into_segments(total_bytes, segments):
+    """the [start, end) byte ranges of segments nearly equal parts of a file"""
+
+    boundaries = [total_bytes * index // segments for index in range(segments + 1)]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _probe_range_support(url, request_modifier, open_url):
+    """the size of the file at url and the response headers, the size is None if the server doesn't support ranges"""
+
+    _, headers, response = open_url(url, request_modifier=RangeRequestModifier(0, request_modifier, end=0))
+    response.close()
+
+    total_bytes = None
+    if response.getcode() == http.HTTPStatus.PARTIAL_CONTENT:
+        total_bytes = get_total_size(headers)
+
+    return total_bytes, headers
+
+
+class _SegmentedDownload:
+
+    def __init__(self, url, partial_file, request_modifier, buffer_size, retries, progress_callbacks, total_bytes,
+                 digest, open_url):
+        self._url = url
+        self._open_url = open_url
+        self._partial_file = partial_file
+        self._request_modifier = request_modifier
+        self._buffer_size = buffer_size
+        self._retries = retries
+        self._progress_callbacks = progress_callbacks
+        self._total_bytes = total_bytes
+        self._digest = digest
+
+        self._bytes_done = 0
+        self._lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def _written(self, index, position, length):
+        with self._lock:
+            self._bytes_done += length
+            for callback in self._progress_callbacks:
+                callback(self._url, self._bytes_done, self._total_bytes)
+
+        if self._digest is not None:
+            self._digest.written(index, position)
+
+    def _copy_range(self, index, position, end, file_handle):
+
+        _, _, response = self._open_url(self._url,
+                                        request_modifier=RangeRequestModifier(position, self._request_modifier, end - 1))
+        try:
+            if response.getcode() != http.HTTPStatus.PARTIAL_CONTENT:
+                raise DownloadError(f'Download failed: the server for {self._url} ignored a range request')
+
+            file_handle.seek(position)
+            while position < end and not self.cancelled.is_set():
+                data = response.read(min(self._buffer_size, end - position))
+                if not data:
+                    raise http.client.IncompleteRead(b'', end - position)
+
+                file_handle.write(data)
+                file_handle.flush()
+                position += len(data)
+
+                self._written(index, position, len(data))
+        finally:
+            response.close()
+
+        return position
+
+    def download_segment(self, index, start, end):
+
+        position = start
+        attempt = 0
+        with open(self._partial_file, 'r+b') as file_handle:
+            file_handle.seek(start)
+            while position < end and not self.cancelled.is_set():
+                try:
+                    position = self._copy_range(index, position, end, file_handle)
+                except (http.client.HTTPException, OSError) as e:
+                    attempt += 1
+                    if attempt > self._retries:
+                        raise DownloadError(f'Download failed: segment {index} of {self._url} was interrupted '
+                                            f'{attempt} times, last error {e!r}')
+
+                    logger.warning(f'download of segment {index} of {self._url} interrupted at byte {position}, resuming '
+                            f'[{e!r}]')
+                    position = file_handle.tell()
+
+                    # a cancelled download doesn't wait out the backoff
+                    self.cancelled.wait(retry_delay(attempt))
+
+
+def download_segmented(url, partial_file, segments, request_modifier=None, buffer_size=DOWNLOAD_BUFFER_SIZE,
+                       retries=DOWNLOAD_RETRIES, progress_callbacks=(), hash_algorithm=None, open_url=open_url):
+    """download url into partial_file with segments concurrent range requests, a single stream is used instead if
+    the server doesn't support range requests, the segments would be small or a partial download is being continued"""
+
+    total_bytes = None
+    if segments > 1 and not os.path.exists(partial_file):
+        total_bytes, headers = _probe_range_support(url, request_modifier, open_url)
+
+    if total_bytes is None or total_bytes < segments * MIN_SEGMENT_SIZE:
+        return download_to_file(url, partial_file, request_modifier=request_modifier, buffer_size=buffer_size,
+                                retries=retries, progress_callbacks=progress_callbacks, hash_algorithm=hash_algorithm,
+                                open_url=open_url)
+
+    ranges = split_into_segments(total_bytes, segments)
+    with open(partial_file, 'wb') as file_handle:
+        file_handle.truncate(total_bytes)
+
+    digest = OrderedFileDigest(partial_file, ranges, hash_algorithm, buffer_size) if hash_algorithm else None
+    download = _SegmentedDownload(url, partial_file, request_modifier, buffer_size, retries, progress_callbacks,
+                                  total_bytes, digest, open_url)
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [executor.submit(download.download_segment, index, start, end)
+                       for index, (start, end) in enumerate(ranges)]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                download.cancelled.set()
+                raise
+    except Exception:
+        # a file with missing segments can't be continued by a single stream
+        os.remove(partial_file)
+        raise
+    finally:
+        if digest is not None:
+            digest.close()
+
+    return DownloadResult(headers, digest.hexdigest() if digest is not None else None)
@@ -1,14 +1,18 @@
 import base64
 import http
 import os
-import shutil
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import spack
+import spack.caches
+import spack.mirror
 from spack.fetch_strategy import URLFetchStrategy
 from spack.fetch_strategy import fetcher, _needs_stage, FailedDownloadError
 import spack.util.spack_yaml as syaml
+import spack.util.crypto as crypto
 
 from llnl.util.filesystem import  working_dir
 from spack.util.web import SpackWebError
@@ -20,11 +24,26 @@ from six.moves.urllib.request import Request
 from six.moves.urllib.error import URLError
 import ssl
 
-from collections import namedtuple
+from .downloads import RequestInfo, DownloadError, DOWNLOAD_TIMEOUT, DOWNLOAD_BUFFER_SIZE, DOWNLOAD_RETRIES, \
+    RangeRequestModifier, TerminalProgress, FollowingFileDigest, download_segmented
 
 ENVIRONMENT_AS_FILE = '@ENVIRON'
 
-RequestInfo = namedtuple('RequestInfo', 'url timeout cafile capath context'.split())
+# urllib downloads are read in blocks of DOWNLOAD_BUFFER_SIZE and an interrupted download is resumed DOWNLOAD_RETRIES
+# times, both can be changed with the buffer_size and retries fetch options
+
+# the number of archives of a package and its resources that are downloaded at once, can be changed with the
+# environment variable NMRPACK_FETCH_JOBS
+FETCH_JOBS = 4
+FETCH_JOBS_ENVIRON = 'NMRPACK_FETCH_JOBS'
+
+# a urllib download can be split into this many concurrent range requests, set with the segments fetch option or the
+# environment variable NMRPACK_FETCH_SEGMENTS
+FETCH_SEGMENTS = 1
+FETCH_SEGMENTS_ENVIRON = 'NMRPACK_FETCH_SEGMENTS'
+
+# the digest computed while a file is downloaded if the fetcher doesn't have an expected digest to choose one
+DOWNLOAD_HASH_ALGORITHM = 'sha256'
 
 class RequestModifier:
     def __call__(self, url, timeout, cafile=None, capath=None, context=None) -> RequestInfo:
@@ -34,6 +53,13 @@ class ArgModifier:
     def __call__(self, args):
         ...
 
+class ReadFromUrlError(SpackWebError):
+    """read_from_url failed, code is the HTTP status if the server replied with an error"""
+
+    def __init__(self, msg, code=None):
+        super(ReadFromUrlError, self).__init__(msg)
+        self.code = code
+
 def read_from_url(url, accept_content_type=None, request_modifier: RequestModifier=None) -> RequestInfo:
 
     parsed_url = url_util.parse(url)
@@ -57,71 +83,94 @@ def read_from_url(url, accept_content_type=None, request_modifier: RequestModifi
             if not __UNABLE_TO_VERIFY_SSL:
                 context = ssl._create_unverified_context()
 
-    req = Request(url_util.format(parsed_url))
-
     content_type = None
     is_web_url = parsed_url.scheme in ('http', 'https')
 
-    if accept_content_type and is_web_url:
-        # Make a HEAD request first to check the content type.  This lets
-        # us ignore tarballs and gigantic files.
-        # It would be nice to do this with the HTTP Accept header to avoid
-        # one round-trip.  However, most servers seem to ignore the header
-        # if you ask for a tarball with Accept: text/html.
-        req.get_method = lambda: "HEAD"
-
-
-    # Do the real GET request when we know it's just HTML.
-    req.get_method = lambda: "GET"
-
-    local_timeout = _timeout
-    if request_modifier is not None:
+    def open_request(method, timeout):
+        req = Request(url_util.format(parsed_url))
+        req.get_method = lambda: method
 
-        modified_request = request_modifier(req, timeout=_timeout, context=context)
-        req = modified_request.url
-        local_timeout = modified_request.timeout
-        context = modified_request.context
+        local_timeout = timeout
+        local_context = context
+        if request_modifier is not None:
+            modified_request = request_modifier(req, timeout=timeout, context=context)
+            req = modified_request.url
+            local_timeout = modified_request.timeout
+            local_context = modified_request.context
 
+        return _urlopen(req, timeout=local_timeout, context=local_context)
 
     try:
-        resp = _urlopen(req, timeout=local_timeout, context=context)
-
-        content_type = get_header(resp.headers, 'Content-type')
+        if accept_content_type and is_web_url:
+            # Make a HEAD request first to check the content type.  This lets
+            # us ignore tarballs and gigantic files.
+            # It would be nice to do this with the HTTP Accept header to avoid
+            # one round-trip.  However, most servers seem to ignore the header
+            # if you ask for a tarball with Accept: text/html.
+            head_response = open_request('HEAD', _timeout)
+            content_type = get_header(head_response.headers, 'Content-type')
+            head_response.close()
+
+            if _reject_content_type(parsed_url, accept_content_type, content_type):
+                return None, None, None
+
+        # otherwise the headers are taken from the response that streams the body so the file is only requested once
         try:
-            response = _urlopen(req, timeout=1000000, context=context)
+            response = open_request('GET', DOWNLOAD_TIMEOUT)
         except URLError as err:
+            if getattr(err, 'code', None) is not None:
+                raise
             raise SpackWebError('Download failed: {ERROR}'.format(
                 ERROR=str(err)))
 
         if accept_content_type and not is_web_url:
             content_type = get_header(response.headers, 'Content-type')
 
-        reject_content_type = (
-                accept_content_type and (
-                content_type is None or
-                not content_type.startswith(accept_content_type)))
-
-        if reject_content_type:
-            tty.debug("ignoring page {0}{1}{2}".format(
-                url_util.format(parsed_url),
-                " with content type " if content_type is not None else "",
-                content_type or ""))
-
-            return None, None, None
+            if _reject_content_type(parsed_url, accept_content_type, content_type):
+                response.close()
+                return None, None, None
 
         result = response.geturl(), response.headers, response
 
+    except SpackWebError:
+        raise
+
     except Exception as e:
 
-        if e.code == http.HTTPStatus.UNAUTHORIZED:
+        code = getattr(e, 'code', None)
+        if code == http.HTTPStatus.UNAUTHORIZED:
             msg = f'''Error: Could not access {url} because access is not authorized [HTTP Error 401 - Unauthorized]
                              this may mean the user name or password in your configuration file is wrong out of date!'''
+        elif code is not None:
+            msg = f'Error: Could not access {url} because of HTTP Error: {code} [{http.HTTPStatus(code).phrase}]'
         else:
-            msg = f'Error: Could not access {url} because of HTTP Error: {e.code} [{http.HTTPStatus(e.code).phrase}]'
+            msg = f'Error: Could not access {url} because {e}'
 
         tty.msg(msg)
 
-        raise SpackWebError(msg)
+        raise ReadFromUrlError(msg, code)
+
+    return result
+
+
+def _reject_content_type(parsed_url, accept_content_type, content_type):
+    result = content_type is None or not content_type.startswith(accept_content_type)
+
+    if result:
+        tty.debug("ignoring page {0}{1}{2}".format(
+            url_util.format(parsed_url),
+            " with content type " if content_type is not None else "",
+            content_type or ""))
+
+    return result
+
+def open_url_for_download(url, request_modifier=None):
+    """read_from_url for the helpers in downloads, which expect a DownloadError when a request fails"""
+
+    try:
+        result = read_from_url(url, request_modifier=request_modifier)
+    except SpackWebError as e:
+        raise DownloadError(str(e), getattr(e, 'code', None)) from e
 
     return result
 
@@ -187,6 +236,22 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
 
         super(Password_Fetcher_Strategy_Base, self).__init__(**kwargs)
 
+        self.progress_callbacks = []
+
+        # progress bars are turned off while archives are downloaded together so they don't overwrite each other
+        self.show_progress = True
+
+        # set by prefetch_together, the archives of the group are all downloaded when this fetcher is first used
+        self.prefetch_group = None
+
+        # the digest of the archive computed as it was downloaded by this fetcher
+        self.downloaded_digest = None
+
+    def add_progress_callback(self, callback):
+        """callback(url, bytes_done, total_bytes) is called as each block of a urllib download is written, total_bytes
+        is None if the server doesn't report the size"""
+        self.progress_callbacks.append(callback)
+
 
     def _get_request_modifier(self):
 
@@ -217,15 +282,33 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
     def _fetch_urllib(self, url):
 
         save_file = None
+        partial_file = None
         if self.stage.save_filename:
             save_file = self.stage.save_filename
+            partial_file = self.stage.save_filename + '.part'
         tty.msg('Fetching {0}'.format(url))
 
+        progress_callbacks = list(self.progress_callbacks)
+        if self.show_progress and sys.stdout.isatty() and tty.msg_enabled():
+            progress_callbacks.append(TerminalProgress())
+
+        self.downloaded_digest = None
+        hash_algorithm = self._get_download_hash_algorithm()
+
         request_modifier = self._get_request_modifier()
-        # Run urllib but grab the mime type from the http headers
+        # Run urllib but grab the mime type from the http headers, the partial file is kept on failure so the next
+        # fetch continues from where this one stopped
+        segments = self.extra_options.get('segments', get_environment_int(FETCH_SEGMENTS_ENVIRON, FETCH_SEGMENTS))
         try:
-            url, headers, response = read_from_url(url, request_modifier=request_modifier)
-        except SpackWebError as e:
+            headers, digest = download_segmented(url, partial_file, int(segments),
+                                                 request_modifier=request_modifier,
+                                                 buffer_size=int(self.extra_options.get('buffer_size',
+                                                                                        DOWNLOAD_BUFFER_SIZE)),
+                                                 retries=int(self.extra_options.get('retries', DOWNLOAD_RETRIES)),
+                                                 progress_callbacks=progress_callbacks,
+                                                 hash_algorithm=hash_algorithm,
+                                                 open_url=open_url_for_download)
+        except DownloadError as e:
             # clean up archive on failure.
             if self.archive_file:
                 os.remove(self.archive_file)
@@ -234,11 +317,11 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
             msg = 'urllib failed to fetch with error {0}'.format(e)
             raise FailedDownloadError(url, msg)
 
-        with open(save_file, 'wb') as _open_file:
-            shutil.copyfileobj(response, _open_file)
+        self.downloaded_digest = digest
+        tty.debug(f'{hash_algorithm} of {url} computed while downloading {digest}')
 
         self._check_headers(str(headers))
-        return None, save_file
+        return partial_file, save_file
 
     @_needs_stage
     def _fetch_curl(self, url):
@@ -268,7 +351,7 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
         if not spack.config.get('config:verify_ssl'):
             curl_args.append('-k')
 
-        if sys.stdout.isatty() and tty.msg_enabled():
+        if self.show_progress and sys.stdout.isatty() and tty.msg_enabled():
             curl_args.append('-#')  # status bar when using a tty
         else:
             curl_args.append('-sS')  # show errors if fail
@@ -290,11 +373,21 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
             # Timeout if can't establish a connection after n sec.
             curl_args.extend(['--connect-timeout', str(connect_timeout)])
 
+        # hash the partial file as curl writes it
+        self.downloaded_digest = None
+        follower = None
+        if partial_file:
+            follower = FollowingFileDigest(partial_file, self._get_download_hash_algorithm())
+            follower.start()
+
         # Run curl but grab the mime type from the http headers
         curl = self.curl
-        with working_dir(self.stage.path):
-            curl_args = self.modify_curl_args(curl_args)
-            headers = curl(*curl_args, output=str, fail_on_error=False)
+        try:
+            with working_dir(self.stage.path):
+                curl_args = self.modify_curl_args(curl_args)
+                headers = curl(*curl_args, output=str, fail_on_error=False)
+        finally:
+            digest = follower.finish() if follower else None
 
         if curl.returncode != 0:
             # clean up archive on failure.
@@ -327,9 +420,24 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
                     url,
                     "Curl failed with error %d" % curl.returncode)
 
+        self.downloaded_digest = digest
+
         self._check_headers(headers)
         return partial_file, save_file
 
+    def _get_download_hash_algorithm(self):
+        return crypto.hash_algo_for_digest(self.digest) if self.digest else DOWNLOAD_HASH_ALGORITHM
+
+    @_needs_stage
+    def check(self):
+        """check the archive against the expected digest, an archive this fetcher downloaded was hashed as it was
+        written so it isn't read back from disk again if that digest matches"""
+
+        if self.digest and self.downloaded_digest and self.downloaded_digest == self.digest.lower():
+            tty.debug(f'{self.archive_file} was verified while it was downloaded')
+        else:
+            super(Password_Fetcher_Strategy_Base, self).check()
+
     @classmethod
     def format_name(cls):
         return cls.url_attr.split('_')[0]
@@ -398,19 +506,24 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
             _ = curl(*curl_args, fail_on_error=False, output=os.devnull)
             result =  curl.returncode == 0
         else:
-            # Telling urllib to check if url is accessible
+            # Telling urllib to check if url is accessible by asking for the first byte like curl, so the body isn't
+            # downloaded twice
             try:
-                request_modifier = self._get_request_modifier()
+                request_modifier = RangeRequestModifier(0, self._get_request_modifier(), end=0)
                 url, headers, response = read_from_url(url, request_modifier=request_modifier)
             except spack.util.web.SpackWebError as e:
                 msg = "Urllib fetch failed to verify url {0}".format(url)
                 raise FailedDownloadError(url, msg)
-            result = (response.getcode() is None or response.getcode() == 200)
+            response.close()
+            result = response.getcode() in (None, http.HTTPStatus.OK, http.HTTPStatus.PARTIAL_CONTENT)
 
         return result
 
     def fetch(self):
 
+        if self.prefetch_group is not None:
+            self.prefetch_group.prefetch()
+
         username, password = self.get_credentials_from_configuration()
 
         self.add_credentials_to_curl(username, password)
@@ -419,8 +532,10 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
 
     def add_credentials_to_curl(self, user_name, password):
 
-        self.curl.add_default_arg('-u')
-        self.curl.add_default_arg(f'{user_name}:{password}')
+        # fetch can be called more than once, e.g. by prefetch_stages and then by spack
+        if '-u' not in self.curl.exe:
+            self.curl.add_default_arg('-u')
+            self.curl.add_default_arg(f'{user_name}:{password}')
 
     def get_credentials_from_configuration(self):
 
@@ -482,6 +597,89 @@ class Password_Fetcher_Strategy_Base(URLFetchStrategy):
 #
 
 
+def get_environment_int(name, default):
+    result = default
+    if name in os.environ:
+        try:
+            result = int(os.environ[name])
+        except ValueError:
+            tty.warn(f'{name} should be an integer, got {os.environ[name]}')
+    return result
+
+
+def get_fetch_jobs():
+    return get_environment_int(FETCH_JOBS_ENVIRON, FETCH_JOBS)
+
+
+def is_in_fetch_cache(stage):
+    """true if the archive of stage is in spack's fetch cache [_source-cache] where spack will find it"""
+
+    root = spack.caches.fetch_cache.root
+    return any(os.path.exists(os.path.join(root, rel_path)) for rel_path in stage.mirror_paths or [])
+
+
+def _prefetch(fetcher):
+    result = None
+    fetcher.show_progress = False
+    try:
+        fetcher.fetch()
+    except Exception as e:
+        result = e
+    finally:
+        fetcher.show_progress = True
+    return result
+
+
+class PrefetchGroup:
+    """the stages of a package and its resources with password fetchers, all their archives are downloaded at once
+    when spack first asks one of the fetchers to fetch. By then spack has validated the spec and not found that archive
+    in the fetch cache or a mirror. Archives already in the fetch cache are left for spack to copy, and nothing is
+    prefetched if mirrors are configured as spack tries them first"""
+
+    def __init__(self, stages, jobs=None):
+        self._stages = [stage for stage in stages
+                        if isinstance(stage.default_fetcher, Password_Fetcher_Strategy_Base)]
+        self._jobs = get_fetch_jobs() if jobs is None else jobs
+        self._lock = threading.Lock()
+        self._started = False
+
+        for stage in self._stages:
+            stage.default_fetcher.prefetch_group = self
+
+    def prefetch(self):
+        """download the archives of the group that spack would download itself, only the first call does anything,
+        a download that fails is only logged, spack tries it again when it fetches that stage and reports the error"""
+
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        if self._jobs < 2 or spack.mirror.MirrorCollection():
+            return
+
+        stages = [stage for stage in self._stages
+                  if not is_in_fetch_cache(stage) and not stage.default_fetcher.archive_file]
+        if len(stages) < 2:
+            return
+
+        for stage in stages:
+            stage.create()
+
+        tty.msg(f'Fetching {len(stages)} archives at once')
+        with ThreadPoolExecutor(max_workers=min(self._jobs, len(stages))) as executor:
+            errors = executor.map(_prefetch, [stage.default_fetcher for stage in stages])
+
+            for stage, error in zip(stages, errors):
+                if error is not None:
+                    tty.debug(f'prefetching {stage.default_fetcher.url} failed because {error}')
+
+
+def prefetch_together(stages, jobs=None):
+    """download the archives of stages, e.g. a package and its resources, together when spack starts fetching them"""
+    return PrefetchGroup(stages, jobs)
+
+
 class DownloadFailedException(Exception):
     def __init__(self, msg):
         super(DownloadFailedException, self).__init__(msg)
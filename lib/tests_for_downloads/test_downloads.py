@@ -0,0 +1,234 @@
+import hashlib
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from urllib.request import Request
+
+import pytest
+
+import lib.downloads
+from lib.downloads import DownloadError, download_to_file, download_segmented, FollowingFileDigest, OrderedFileDigest, \
+    RangeRequestModifier, split_into_segments
+
+BODY = b'flibbertigibbet' * 1024
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    requests = []
+    ranges = []
+    drop_after = None
+    support_ranges = True
+    fail_with = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self):
+        self.requests.append((self.command, self.path, self.headers.get('Authorization')))
+
+        start = 0
+        range_header = self.headers.get('Range')
+        self.ranges.append(range_header)
+        if range_header and self.support_ranges:
+            start, end = range_header[len('bytes='):].split('-')
+            start, end = int(start), int(end) + 1 if end else len(BODY)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(BODY)}')
+        else:
+            start, end = 0, len(BODY)
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+
+        return start, end
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        if self.fail_with:
+            self.ranges.append(self.headers.get('Range'))
+            self.send_error(self.fail_with.pop(0))
+            return
+
+        start, end = self._send_headers()
+        if self.drop_after is not None and start < self.drop_after < end:
+            self.wfile.write(BODY[start:self.drop_after])
+            CountingHandler.drop_after = None
+            self.close_connection = True
+        else:
+            self.wfile.write(BODY[start:end])
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(lib.downloads, 'DOWNLOAD_BACKOFF', 0)
+
+
+@pytest.fixture
+def server_url():
+    CountingHandler.requests = []
+    CountingHandler.ranges = []
+    CountingHandler.drop_after = None
+    CountingHandler.support_ranges = True
+    CountingHandler.fail_with = []
+    server = ThreadingHTTPServer(('localhost', 0), CountingHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://localhost:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_range_request_modifier():
+    def add_authorisation(url, timeout, cafile=None, capath=None, context=None):
+        url.add_header('Authorization', 'Basic abc')
+        return lib.downloads.RequestInfo(url, timeout, cafile, capath, context)
+
+    request = RangeRequestModifier(100, add_authorisation, end=199)(Request('http://localhost/a.tar.gz'), 10).url
+    assert request.get_header('Range') == 'bytes=100-199'
+    assert request.get_header('Authorization') == 'Basic abc'
+
+    assert RangeRequestModifier(100)(Request('http://localhost/a.tar.gz'), 10).url.get_header('Range') == 'bytes=100-'
+    assert RangeRequestModifier(0)(Request('http://localhost/a.tar.gz'), 10).url.get_header('Range') is None
+
+
+def test_download_to_file_resumes_interrupted_download(server_url, tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+    CountingHandler.drop_after = len(BODY) // 3
+    progress = []
+
+    result = download_to_file(f'{server_url}/test.tar.gz', str(partial_file), buffer_size=1024,
+                              progress_callbacks=[lambda url, done, total: progress.append((done, total))],
+                              hash_algorithm='sha256')
+
+    assert partial_file.read_bytes() == BODY
+    assert result.digest == hashlib.sha256(BODY).hexdigest()
+    assert progress[-1] == (len(BODY), len(BODY))
+    assert CountingHandler.ranges == [None, f'bytes={len(BODY) // 3}-']
+
+
+def test_download_to_file_keeps_partial_file_after_server_error(server_url, tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+    partial_file.write_bytes(BODY[:1000])
+    CountingHandler.fail_with = [503]
+
+    download_to_file(f'{server_url}/test.tar.gz', str(partial_file))
+
+    assert partial_file.read_bytes() == BODY
+    assert CountingHandler.ranges == ['bytes=1000-', 'bytes=1000-']
+
+
+def test_download_to_file_backs_off_between_retries(server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(lib.downloads, 'DOWNLOAD_BACKOFF', 1.0)
+    delays = []
+    monkeypatch.setattr(lib.downloads.time, 'sleep', delays.append)
+    CountingHandler.fail_with = [503, 503, 503]
+
+    download_to_file(f'{server_url}/test.tar.gz', str(tmp_path / 'test.tar.gz.part'))
+
+    assert len(delays) == 3
+    for attempt, delay in enumerate(delays):
+        assert 2 ** attempt / 2 <= delay <= 2 ** attempt
+
+
+def test_retry_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(lib.downloads, 'DOWNLOAD_BACKOFF', 1.0)
+    assert lib.downloads.DOWNLOAD_MAX_BACKOFF / 2 <= lib.downloads.retry_delay(100) <= \
+        lib.downloads.DOWNLOAD_MAX_BACKOFF
+
+
+def test_download_to_file_restarts_if_range_not_satisfiable(server_url, tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+    partial_file.write_bytes(BODY[:1000])
+    CountingHandler.fail_with = [416]
+
+    download_to_file(f'{server_url}/test.tar.gz', str(partial_file))
+
+    assert partial_file.read_bytes() == BODY
+    assert CountingHandler.ranges == ['bytes=1000-', None]
+
+
+def test_download_to_file_fails_on_client_error(server_url, tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+    partial_file.write_bytes(BODY[:1000])
+    CountingHandler.fail_with = [404]
+
+    with pytest.raises(DownloadError):
+        download_to_file(f'{server_url}/test.tar.gz', str(partial_file))
+
+    assert partial_file.read_bytes() == BODY[:1000]
+
+
+def test_download_to_file_restarts_without_range_support(server_url, tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+    partial_file.write_bytes(b'stale')
+    CountingHandler.support_ranges = False
+
+    download_to_file(f'{server_url}/test.tar.gz', str(partial_file))
+
+    assert partial_file.read_bytes() == BODY
+
+
+def test_download_segmented(server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(lib.downloads, 'MIN_SEGMENT_SIZE', 1024)
+    partial_file = tmp_path / 'test.tar.gz.part'
+    CountingHandler.drop_after = len(BODY) // 2 + 100
+
+    result = download_segmented(f'{server_url}/test.tar.gz', str(partial_file), 4, buffer_size=1000,
+                                hash_algorithm='sha256')
+
+    assert partial_file.read_bytes() == BODY
+    assert result.digest == hashlib.sha256(BODY).hexdigest()
+
+    # a probe, 4 segments and a resumed segment
+    assert len(CountingHandler.ranges) == 6
+    assert CountingHandler.ranges[0] == 'bytes=0-0'
+
+
+def test_download_segmented_without_range_support(server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(lib.downloads, 'MIN_SEGMENT_SIZE', 1024)
+    partial_file = tmp_path / 'test.tar.gz.part'
+    CountingHandler.support_ranges = False
+
+    result = download_segmented(f'{server_url}/test.tar.gz', str(partial_file), 4, hash_algorithm='sha256')
+
+    assert partial_file.read_bytes() == BODY
+    assert result.digest == hashlib.sha256(BODY).hexdigest()
+    assert len(CountingHandler.requests) == 2
+
+
+def test_following_file_digest(tmp_path):
+    partial_file = tmp_path / 'test.tar.gz.part'
+
+    follower = FollowingFileDigest(str(partial_file), 'sha256', buffer_size=1000)
+    follower.start()
+
+    with open(partial_file, 'wb') as file_handle:
+        for start in range(0, len(BODY), 4096):
+            file_handle.write(BODY[start:start + 4096])
+            file_handle.flush()
+            time.sleep(0.01)
+
+    assert follower.finish() == hashlib.sha256(BODY).hexdigest()
+
+
+def test_ordered_file_digest(tmp_path):
+    file_name = tmp_path / 'test.tar.gz.part'
+    file_name.write_bytes(b'\0' * len(BODY))
+    segments = split_into_segments(len(BODY), 3)
+
+    digest = OrderedFileDigest(str(file_name), segments, 'sha256', buffer_size=1000)
+    with open(file_name, 'r+b') as file_handle:
+        # write the segments last first so the digest has to wait for the first one
+        for index, (start, end) in reversed(list(enumerate(segments))):
+            file_handle.seek(start)
+            file_handle.write(BODY[start:end])
+            file_handle.flush()
+            digest.written(index, end)
+
+            if index:
+                with pytest.raises(ValueError):
+                    digest.hexdigest()
+    digest.close()
+
+    assert digest.hexdigest() == hashlib.sha256(BODY).hexdigest()
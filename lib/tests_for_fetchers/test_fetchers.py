@@ -0,0 +1,113 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+import pytest
+
+pytest.importorskip('spack')
+
+import lib.fetchers
+from lib.fetchers import read_from_url, BasicAuthorisationModifier, Password_Fetcher_Strategy_Base, prefetch_together
+
+BODY = b'flibbertigibbet' * 1024
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self):
+        self.requests.append((self.command, self.path, self.headers.get('Authorization')))
+
+        body = BODY[:1] if self.headers.get('Range') == 'bytes=0-0' else BODY
+        self.send_response(206 if len(body) == 1 else 200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        return body
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        self.wfile.write(self._send_headers())
+
+
+@pytest.fixture
+def server_url():
+    CountingHandler.requests = []
+    server = ThreadingHTTPServer(('localhost', 0), CountingHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://localhost:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_read_from_url_makes_one_request(server_url):
+    modifier = BasicAuthorisationModifier('user', 'secret')
+
+    url, headers, response = read_from_url(f'{server_url}/test.tar.gz', request_modifier=modifier)
+
+    assert response.read() == BODY
+    assert headers['Content-Type'] == 'application/x-gzip'
+    assert [(method, path) for method, path, _ in CountingHandler.requests] == [('GET', '/test.tar.gz')]
+    assert CountingHandler.requests[0][2].startswith('Basic ')
+
+
+def test_read_from_url_checks_content_type_with_head(server_url):
+
+    assert read_from_url(f'{server_url}/test.tar.gz', accept_content_type='text/html') == (None, None, None)
+    assert [method for method, _, _ in CountingHandler.requests] == ['HEAD']
+
+    CountingHandler.requests.clear()
+    url, headers, response = read_from_url(f'{server_url}/test.tar.gz', accept_content_type='application/x-gzip')
+
+    assert response.read() == BODY
+    assert [method for method, _, _ in CountingHandler.requests] == ['HEAD', 'GET']
+
+
+def test_existing_url_only_asks_for_one_byte(server_url, monkeypatch):
+    class TestFetcher(Password_Fetcher_Strategy_Base):
+        url_attr = 'test_url'
+
+    fetcher = TestFetcher(test_url=f'{server_url}/test.tar.gz')
+    monkeypatch.setattr(fetcher, '_get_request_modifier', lambda: BasicAuthorisationModifier('user', 'secret'))
+
+    assert fetcher._existing_url(f'{server_url}/test.tar.gz')
+    assert [(method, path) for method, path, _ in CountingHandler.requests] == [('GET', '/test.tar.gz')]
+
+
+def test_prefetch_together_skips_cached_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(lib.fetchers, 'is_in_fetch_cache', lambda stage: stage.default_fetcher.url == 'cached')
+    monkeypatch.setattr(lib.fetchers.spack.mirror, 'MirrorCollection', dict)
+    fetched = []
+
+    class TestFetcher(Password_Fetcher_Strategy_Base):
+        url_attr = 'test_url'
+
+        def __init__(self, url):
+            self.url = url
+            self.archive_file = None
+            self.prefetch_group = None
+            self.show_progress = True
+
+        def fetch(self):
+            self.prefetch_group.prefetch()
+            if not self.archive_file:
+                fetched.append((self.url, self.show_progress))
+                self.archive_file = self.url
+
+    class TestStage:
+        def __init__(self, url):
+            self.default_fetcher = TestFetcher(url)
+
+        def create(self):
+            pass
+
+    stages = [TestStage(url) for url in ('root', 'cached', 'resource')]
+    prefetch_together(stages, jobs=2)
+
+    stages[0].default_fetcher.fetch()
+
+    assert sorted(fetched) == [('resource', False), ('root', False)]
@@ -31,6 +31,7 @@ if not package_root in sys.path:
     sys.path.insert(0, package_root)
 
 from nmrpack.lib.yaml_package import read_releases
+from nmrpack.lib.fetchers import prefetch_together
 
 # this triggers
 from nmrpack.packages.xplor import xplor_fetcher
@@ -87,6 +88,15 @@ class Xplor(Package):
 
         return result
 
+    def do_fetch(self, mirror_only=False):
+
+        # the db and platform tarballs are large so download them all at once rather than one after another, this
+        # only happens once spack has checked the spec and has to download the first archive
+        if not mirror_only:
+            prefetch_together(self.stage)
+
+        super(Xplor, self).do_fetch(mirror_only)
+
     def install(self, spec, prefix):
 
         resource_filenames = self.installable_resource_filenames(spec)
@@ -0,0 +1,104 @@
+import argparse
+import http.server
+import os
+import threading
+from time import perf_counter
+
+import requests
+
+from checksum_url import MultiDigester, hash_from_readinto, chunk_size_range, size_in_bytes, chunk_size_or_auto, \
+    human_size, AUTO
+
+# micro benchmark comparing the old fixed 4096 byte iter_content download loop with the buffer reusing
+# [optionally adaptive] loop used by get_hash_from_url, the data is served from memory on localhost so
+# the numbers measure the overhead of the python loop rather than the network
+
+
+def create_payload_handler(payload):
+
+    class PayloadHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PayloadHandler
+
+
+def start_server(payload):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), create_payload_handler(payload))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def hash_with_iter_content(target_session, target_url, chunk_size=4096):
+    digester = MultiDigester()
+    response = target_session.get(target_url, stream=True)
+    for data in response.iter_content(chunk_size=chunk_size):
+        digester.update(data)
+    return digester.hexdigests()
+
+
+def hash_with_readinto(target_session, target_url, chunk_size=AUTO):
+    digester = MultiDigester()
+    response = target_session.get(target_url, stream=True)
+    response.raw.decode_content = True
+    min_chunk_size, max_chunk_size = chunk_size_range(chunk_size)
+    hash_from_readinto(response.raw.readinto, digester, min_chunk_size, max_buffer_size=max_chunk_size)
+    return digester.hexdigests()
+
+
+def time_method(method, repeats, *args):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = perf_counter()
+        result = method(*args)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the download hashing loop of checksum_url.py')
+    parser.add_argument('-s', '--size', dest='size', type=size_in_bytes, default=size_in_bytes('256M'),
+                        help='size of the payload to download [default: 256M]')
+    parser.add_argument('-r', '--repeats', dest='repeats', type=int, default=3,
+                        help='number of times to repeat each measurement, the best is reported [default: 3]')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=chunk_size_or_auto, default=AUTO,
+                        help='chunk size for the readinto loop [default: auto]')
+
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size)
+    server = start_server(payload)
+    url = f'http://127.0.0.1:{server.server_address[1]}/payload'
+
+    session = requests.session()
+
+    methods = {
+        'iter_content(4096)': (hash_with_iter_content,),
+        f'readinto({args.chunk_size})': (hash_with_readinto, args.chunk_size),
+    }
+
+    digests = set()
+    baseline = None
+    for name, (method, *method_args) in methods.items():
+        elapsed, digest = time_method(method, args.repeats, session, url, *method_args)
+        digests.add(tuple(digest.items()))
+
+        rate = args.size / elapsed
+        baseline = rate if baseline is None else baseline
+        print(f'{name:<24} {human_size(rate)}/s  x{rate / baseline:.2f}')
+
+    if len(digests) != 1:
+        print('ERROR: the methods produced different digests!')
+
+    server.shutdown()
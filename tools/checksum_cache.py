@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import yaml
+
+# the cache file for checksum_url.py is a journal of JSON lines, each line records the current value of one key
+# [{"key": ..., "value": ...}] and later lines replace earlier ones, every digest is appended as soon as it is
+# calculated so an interrupted run keeps all the work done before it stopped, older cache files that were a
+# single YAML / JSON document are read but never changed, their journal is kept next to them with the suffix .jsonl
+
+KEY = 'key'
+VALUE = 'value'
+
+JOURNAL_SUFFIX = '.jsonl'
+
+# rewrite the journal when it holds this many times more records than keys
+COMPACT_RATIO = 2
+
+
+def _is_journal_record(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None
+    return isinstance(record, dict) and set(record) == {KEY, VALUE}
+
+
+def _read_lines(path):
+    try:
+        with open(path) as file_handle:
+            result = file_handle.readlines()
+    except IOError as err:
+        print(f"WARNING: cache file {path} can't be opened {err} ignored!", file=sys.stderr)
+        result = None
+    return result
+
+
+def _is_journal(lines):
+    first_line = next((line for line in lines if line.strip()), None)
+    return first_line is not None and _is_journal_record(first_line)
+
+
+class JournalCache(dict):
+    """a dict of cached values backed by an append only JSON lines journal, call commit(key) after a value
+    has been changed to record it. If file_name is an older YAML / JSON cache it is only read and the journal is
+    the file with the same name and the suffix .jsonl"""
+
+    def __init__(self, file_name):
+        super(JournalCache, self).__init__()
+        self._legacy_path = None
+        self._path = Path(file_name)
+        self._file_handle = None
+        self._num_records = 0
+
+        self._load()
+
+    @property
+    def journal_path(self):
+        return self._path
+
+    def _load(self):
+        lines = _read_lines(self._path) if self._path.is_file() else None
+
+        if self._path.suffix != JOURNAL_SUFFIX and (lines is None or not _is_journal(lines)):
+            self._legacy_path = self._path
+            self._path = self._path.with_suffix(JOURNAL_SUFFIX)
+
+            if self._path.is_file():
+                self._load_journal(_read_lines(self._path) or [])
+            elif lines is not None:
+                self._load_legacy(''.join(lines))
+        elif lines is not None:
+            self._load_journal(lines)
+
+    def _load_journal(self, lines):
+        bad_lines = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                self[record[KEY]] = record[VALUE]
+                self._num_records += 1
+            except (ValueError, KeyError, TypeError):
+                # most likely a line that was being written when a run was interrupted
+                bad_lines += 1
+
+        if bad_lines:
+            print(f'WARNING: ignored {bad_lines} unreadable line(s) in cache file {self._path}', file=sys.stderr)
+
+        if bad_lines or self._num_records > COMPACT_RATIO * len(self):
+            self.compact()
+
+    def _load_legacy(self, text):
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as err:
+            print(f"WARNING: cache file {self._legacy_path} can't be read {err} ignored!", file=sys.stderr)
+            data = None
+
+        if isinstance(data, dict):
+            self.update(data)
+            self.compact()
+
+    def _open(self):
+        if self._file_handle is None:
+            self._file_handle = open(self._path, 'a')
+        return self._file_handle
+
+    def commit(self, key):
+        file_handle = self._open()
+        file_handle.write(json.dumps({KEY: key, VALUE: self[key]}) + '\n')
+        file_handle.flush()
+        os.fsync(file_handle.fileno())
+        self._num_records += 1
+
+    def compact(self):
+        """rewrite the journal with a single record per key"""
+        self.close()
+
+        temp_path = self._path.with_name(self._path.name + '.tmp')
+        with open(temp_path, 'w') as file_handle:
+            for key, value in self.items():
+                file_handle.write(json.dumps({KEY: key, VALUE: value}) + '\n')
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+        os.replace(temp_path, self._path)
+
+        self._num_records = len(self)
+
+    def close(self):
+        if self._file_handle is not None:
+            self._file_handle.close()
+            self._file_handle = None
@@ -49,23 +49,24 @@ class SpackOutput(OutputBase):
     def __init__(self, target_args=None):
         super(SpackOutput, self).__init__(target_args=target_args)
         self._info = {}
-        self._hash_type = None
 
-    def display_hash(self, target_url, _hash, url_field_length, index, num_urls=None, hash_type=None):
+    def display_hash(self, target_url, digests, url_field_length, index, num_urls=None):
 
-        self._hash_type = hash_type
-        self._info[target_url] = _hash
+        self._info[target_url] = digests
 
     def _ordered_urls(self):
         for elem in self._info:
             yield elem
 
     def _check_digests_agree(self, url, extra_version_info, i):
-        pip_digest = extra_version_info[url]['digests'][self.digest]
-        download_digest = self._info[url]
-        if not pip_digest == download_digest:
-            msg = f"for url {url} {self.digest} from pip [{pip_digest}] and download [{download_digest}] don't agree"
-            raise Exception(msg)
+        pip_digests = extra_version_info[url]['digests']
+        for digest, download_digest in self._info[url].items():
+            if digest not in pip_digests:
+                continue
+            pip_digest = pip_digests[digest]
+            if not pip_digest == download_digest:
+                msg = f"for url {url} {digest} from pip [{pip_digest}] and download [{download_digest}] don't agree"
+                raise Exception(msg)
 
     def _should_expand(self, url):
 
@@ -1,5 +1,8 @@
 
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from fnmatch import fnmatch
+from http import HTTPStatus
 
 from cmp_version import VersionString
 # noinspection PyUnresolvedReferences
@@ -9,10 +12,17 @@ from plugins import register_navigator
 from .url_navigator_plugin import UrlNavigator
 # noinspection PyUnresolvedReferences
 from checksum_url import TYPE, MAIN_FILE, EXTRA_FILE, FORMAT, VERSION, NAME, INFO, WEBSITE, DEPENDENCIES, DIGESTS
-from urllib.parse import urlparse, unquote
-from json import loads
+from urllib.parse import urlparse, unquote, parse_qs, urlencode
 from pathlib import Path
 
+DEFAULT_PER_PAGE = 100
+
+# the parts of each page of releases kept in the cache
+ETAG = 'etag'
+NEXT = 'next'
+LAST = 'last'
+RELEASES = 'releases'
+
 
 def split_url_to_path_and_file(target_url):
     url_parts = urlparse(target_url)
@@ -35,6 +45,27 @@ def url_to_releases_url(target_url, has_file=False):
     return target_url
 
 
+def url_with_query(target_url, **query):
+    url_parts = urlparse(target_url)
+    url_query = parse_qs(url_parts.query)
+    url_query.update({key: [str(value)] for key, value in query.items()})
+    return url_parts._replace(query=urlencode(url_query, doseq=True)).geturl()
+
+
+def page_urls_to_last(last_page_url):
+    """the urls of pages 2 to the last page given the url of the last page from a Link header"""
+    last_page = int(parse_qs(urlparse(last_page_url).query)['page'][0])
+    return [url_with_query(last_page_url, page=page) for page in range(2, last_page + 1)]
+
+
+def trim_release(release):
+    """keep just the fields of a release that are used, full releases are large"""
+    return {
+        'html_url': release['html_url'],
+        'assets': [{'browser_download_url': asset['browser_download_url']} for asset in release['assets']]
+    }
+
+
 @register_navigator()
 class GithubReleaseNavigator(UrlNavigator):
 
@@ -43,19 +74,78 @@ class GithubReleaseNavigator(UrlNavigator):
     def __init__(self, browser, target_args):
         super(GithubReleaseNavigator, self).__init__(browser, target_args)
         self._extra_item_info = {}
+        self._per_page = getattr(target_args, 'per_page', DEFAULT_PER_PAGE)
+        self._cached_pages = {}
+        self._pages = {}
+
+    def get_navigator_cache_data(self):
+        # pages of other repositories [or page sizes] not seen in this run are kept
+        return {**self._cached_pages, **self._pages}
+
+    def set_navigator_cache_data(self, data):
+        self._cached_pages = dict(data)
 
     def login_with_form(self, target_url, username_password, form=None, verbose=0):
 
-        target_url = url_to_releases_url(target_url)
+        self._username_password = username_password
+
+        releases_url = url_with_query(url_to_releases_url(target_url), per_page=self._per_page)
+
+        self._root = self._get_releases(releases_url)
+
+    def _get_release_page(self, page_url):
+        """get a page of releases, if the page was seen before it is only downloaded again if its ETag has changed"""
+
+        cached_page = self._cached_pages.get(page_url)
+        headers = {'If-None-Match': cached_page[ETAG]} if cached_page and cached_page.get(ETAG) else None
+
+        response = transfer_page(self._target_session, page_url, self._username_password, headers=headers)
+
+        if response.status_code == HTTPStatus.NOT_MODIFIED and cached_page:
+            page = cached_page
+        elif response.status_code == HTTPStatus.OK:
+            page = {
+                ETAG: response.headers.get('etag'),
+                NEXT: response.links.get('next', {}).get('url'),
+                LAST: response.links.get('last', {}).get('url'),
+                RELEASES: [trim_release(release) for release in response.json()]
+            }
+        else:
+            page = None
+
+        response.close()
+
+        if page is not None:
+            self._pages[page_url] = page
+
+        return page, response.status_code
+
+    def _get_releases(self, releases_url):
+        """get all the releases following the Link headers of the pages, with --jobs > 1 the pages after the first
+        are fetched concurrently"""
+
+        first_page, status_code = self._get_release_page(releases_url)
+        if first_page is None:
+            print(f"the web site {releases_url} isn't accessible [{status_code}]")
+            print('exiting...')
+            sys.exit()
+
+        pages = [first_page]
+        if self._jobs > 1 and first_page[LAST]:
+            with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                results = executor.map(self._get_release_page, page_urls_to_last(first_page[LAST]))
+                pages.extend(page for page, _ in results)
+        else:
+            next_page_url = first_page[NEXT]
+            while next_page_url:
+                page, _ = self._get_release_page(next_page_url)
+                pages.append(page)
+                next_page_url = page[NEXT] if page else None
 
-        response = super(GithubReleaseNavigator, self).login_with_form(target_url, username_password)
+        if any(page is None for page in pages):
+            print(f'WARNING: some pages of releases from {releases_url} could not be read', file=sys.stderr)
 
-        if response.status_code == 200:
-            install_page_url = target_url
-            install_page_response = transfer_page(self._target_session, install_page_url, username_password)
-            self._root = loads(install_page_response.content)
-            if install_page_response.status_code != 200:
-                print(f'WARNING: response from {install_page_url} was {install_page_response.status_code}')
+        return [release for page in pages if page for release in page[RELEASES]]
 
 
     @staticmethod
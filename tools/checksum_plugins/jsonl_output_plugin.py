@@ -0,0 +1,39 @@
+import json
+# noinspection PyUnresolvedReferences
+from checksum_url import OutputBase
+from plugins import register_output
+
+
+@register_output()
+class JsonLinesOutput(OutputBase):
+    """write a JSON object for each url as soon as it has been hashed, one per line, so a scan can be piped into
+    other tools and watched while it runs"""
+
+    NAME = 'jsonl'
+
+    INCREMENTAL = True
+    MACHINE_READABLE = True
+
+    def __init__(self, target_args=None):
+        super(JsonLinesOutput, self).__init__(target_args=target_args)
+
+    def _write_record(self, record):
+        self._stream.write(json.dumps(record, default=str) + '\n')
+
+    def display_hash(self, target_url, digests, url_field_length, index, num_urls=None):
+        self.on_result(target_url, digests, url_field_length, index, num_urls)
+
+    def on_result(self, target_url, digests, url_field_length, index, num_urls=None, extra_info=None):
+        record = {'index': index, 'url': target_url, 'digests': dict(digests)}
+        if extra_info:
+            record['info'] = extra_info
+        self._write_record(record)
+        self._flush_if_needed()
+
+    def on_error(self, target_url, error, url_field_length, index):
+        reason = getattr(error, 'reason', None) or ' '.join(str(arg) for arg in error.args)
+        self._write_record({'index': index, 'url': target_url, 'error': reason})
+        self._flush_if_needed()
+
+    def finish(self, extra_package_info, extra_version_info):
+        self._stream.flush()
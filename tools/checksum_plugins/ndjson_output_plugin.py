@@ -0,0 +1,21 @@
+# noinspection PyUnresolvedReferences
+from checksum_url import OutputBase, VERSION
+from plugins import register_output
+from .jsonl_output_plugin import JsonLinesOutput
+
+
+@register_output()
+class NdjsonOutput(JsonLinesOutput):
+    """write a flat newline delimited JSON record for each digest of each url, easier to filter with line oriented
+    tools and log processors than the nested records of the jsonl output"""
+
+    NAME = 'ndjson'
+
+    def on_result(self, target_url, digests, url_field_length, index, num_urls=None, extra_info=None):
+        version = extra_info.get(VERSION) if extra_info else None
+        for algorithm, digest in digests.items():
+            record = {'index': index, 'url': target_url, 'algorithm': algorithm, 'digest': digest}
+            if version is not None:
+                record[VERSION] = version
+            self._write_record(record)
+        self._flush_if_needed()
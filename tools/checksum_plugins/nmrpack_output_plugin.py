@@ -28,9 +28,18 @@ class NmrpackOutput(OutputBase):
         super(NmrpackOutput, self).__init__(target_args=target_args)
         self._urls_and_hashes = {}
 
-    def display_hash(self, target_url, hash, url_field_length, index, num_urls=None, hash_type='unknown'):
+    def display_hash(self, target_url, digests, url_field_length, index, num_urls=None):
 
-        self._urls_and_hashes[target_url] = (hash_type, hash)
+        self._urls_and_hashes[target_url] = digests
+
+    @staticmethod
+    def get_resource_hash(digests):
+        # resources are read back as sha256 by yaml_package.read_release
+        if 'sha256' in digests:
+            result = digests['sha256']
+        else:
+            result = next(iter(digests.values()))
+        return result
 
     @staticmethod
     def get_versions_and_urls(extra_version_infos):
@@ -110,7 +119,7 @@ class NmrpackOutput(OutputBase):
 
             main_url = self.get_main_url(versions_and_urls[version])
 
-            version_dict[self._urls_and_hashes[main_url][0]] = self._urls_and_hashes[main_url][1]
+            version_dict.update(self._urls_and_hashes[main_url])
             version_dict['root_url'] = main_url
             if URL_TYPE in extra_version_info[main_url]:
                 version_dict[URL_TYPE] = extra_version_info[main_url][URL_TYPE]
@@ -125,7 +134,7 @@ class NmrpackOutput(OutputBase):
 
 
                     resources[file_name] = {'url': url,
-                                            'hash': self._urls_and_hashes[url][1],
+                                            'hash': self.get_resource_hash(self._urls_and_hashes[url]),
                                             'when': when
                                             }
 
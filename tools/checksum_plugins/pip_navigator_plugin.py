@@ -5,13 +5,11 @@ from plugins import register_navigator
 from .url_navigator_plugin import UrlNavigator
 # noinspection PyUnresolvedReferences
 from checksum_url import TYPE, MAIN_FILE, EXTRA_FILE, EXPAND , VERSION, NAME, INFO, WEBSITE, DEPENDENCIES, DIGESTS
-from http import HTTPStatus
+# noinspection PyUnresolvedReferences
+from pypi_json import PypiMetadata, DEFAULT_TTL
 import json
 
 
-OK = HTTPStatus.OK
-
-
 @register_navigator()
 class PipNavigator(UrlNavigator):
 
@@ -22,6 +20,17 @@ class PipNavigator(UrlNavigator):
         self._raw_extra_info ={}
         self._long_to_short_urls = {}
         self._short_url_release = {}
+        self._info_url = None
+
+        # pypi json responses, kept in the checksum cache [--cache] and revalidated with their ETags once they are
+        # older than DEFAULT_TTL
+        self._pypi_entries = {}
+
+    def get_navigator_cache_data(self):
+        return self._pypi_entries
+
+    def set_navigator_cache_data(self, data):
+        self._pypi_entries = dict(data)
 
     @staticmethod
     def _dump_json(json_data):
@@ -62,23 +71,27 @@ class PipNavigator(UrlNavigator):
 
         return result
 
+    def _fetch_raw_extra_info(self, ttl=DEFAULT_TTL):
+        metadata = PypiMetadata(self._target_session, ttl=ttl, jobs=self._jobs, entries=self._pypi_entries)
+        return metadata.get_url(self._info_url)
+
     def login_with_form(self, root, password, form=None, verbose=False):
         result = super(PipNavigator, self).login_with_form(root, password, form, verbose)
 
-        info_url = self._root_url_to_json(root)
+        self._info_url = self._root_url_to_json(root)
 
-        if not info_url:
+        if not self._info_url:
             print(f'WARNING: url is {root} not interpretable as a pypi url,'
                   f' no extra information will be gathered')
 
-        response = None
-        if info_url:
-            response = transfer_page(self._target_session, info_url)
+        raw_extra_info = None
+        if self._info_url:
+            raw_extra_info = self._fetch_raw_extra_info()
 
-        if response.status_code != OK:
-            print(f"WARNING: couldn't down;load info from {info_url}")
+        if raw_extra_info is None:
+            print(f"WARNING: couldn't download info from {self._info_url}")
         else:
-            self._raw_extra_info = json.loads(response.content)
+            self._raw_extra_info = raw_extra_info
 
         return result
 
@@ -111,32 +124,49 @@ class PipNavigator(UrlNavigator):
 
         long_urls_to_short_pip = self._translate_pip_urls(long_url_versions)
 
-        for release in self._raw_extra_info['releases']:
-            install_formats = self._raw_extra_info['releases'][release]
-            for install_format in install_formats:
-                long_url = install_format['url']
-                if long_url in long_urls_to_short_pip.keys():
-                    short_url = long_urls_to_short_pip[long_url]
-                    self._short_url_release[short_url] = install_format
-                    self._short_url_release[short_url]['version'] = long_url_versions[long_url]
+        self._add_releases(long_urls_to_short_pip, long_url_versions)
+
+        # a cached copy of the json can be older than the index, if it is missing a release fetch it again
+        is_missing_releases = any(url not in self._short_url_release for url in long_urls_to_short_pip.values())
+        if is_missing_releases and self._info_url:
+            raw_extra_info = self._fetch_raw_extra_info(ttl=0)
+            if raw_extra_info is not None:
+                self._raw_extra_info = raw_extra_info
+                self._add_releases(long_urls_to_short_pip, long_url_versions)
 
         results = long_urls_to_short_pip.values()
 
         return results
 
+    def _add_releases(self, long_urls_to_short_pip, long_url_versions):
+        releases = self._raw_extra_info.get('releases', {})
+        for release in releases:
+            install_formats = releases[release]
+            for install_format in install_formats:
+                long_url = install_format['url']
+                if long_url in long_urls_to_short_pip.keys():
+                    short_url = long_urls_to_short_pip[long_url]
+                    self._short_url_release[short_url] = {**install_format, 'version': long_url_versions[long_url]}
+
     def get_extra_info(self, url):
 
         result = {
                     TYPE: MAIN_FILE,
                     EXPAND: False,
                     VERSION: self._get_version(url),
-                    DEPENDENCIES: self._raw_extra_info['info']['requires_dist'],
-                    DIGESTS: self._short_url_release[url]['digests']
+                    DEPENDENCIES: self._raw_extra_info.get('info', {}).get('requires_dist'),
+                    DIGESTS: self.get_upstream_digests(url)
 
         }
 
         return result
 
+    def get_upstream_digests(self, url):
+        return self._short_url_release.get(url, {}).get('digests', {})
+
+    def get_upstream_size(self, url):
+        return self._short_url_release.get(url, {}).get('size')
+
     def get_package_info(self):
 
         return {
@@ -1,11 +1,15 @@
+import codecs
+import re
 import pluggy
 import sys
+from collections import OrderedDict
+from html.parser import HTMLParser
 # noinspection PyUnresolvedReferences
 from checksum_url import  Navigator, transfer_page
 from plugins import register_navigator
-# noinspection PyProtectedMember
-from bs4 import BeautifulSoup, SoupStrainer
-from fnmatch import fnmatch
+from fnmatch import translate
+
+PAGE_CHUNK_SIZE = 64 * 1024
 
 
 
@@ -21,21 +25,64 @@ def check_root_exists_or_exit(root, target_session, username_password=(None, Non
     return response
 
 
-def get_urls_for_templates(target_page, templates):
-    target_urls = []
-    result = []
-    for link in BeautifulSoup(target_page.content, parse_only=SoupStrainer('a'), features="html.parser"):
+def compile_templates(templates):
+    """compile a list of shell style templates into a single regex matching any of them, with no templates the
+    regex matches nothing"""
+    if templates:
+        result = re.compile('|'.join(f'(?:{translate(template)})' for template in templates))
+    else:
+        result = re.compile(r'(?!)')
+    return result
+
+
+class HrefCollector(HTMLParser):
+    """collect the hrefs of the links in a page whose file name matches a regex as the page is fed in, the hrefs are
+    kept once each in the order they first appear, pop_new_hrefs returns those found since it was last called"""
+
+    def __init__(self, matcher):
+        super(HrefCollector, self).__init__(convert_charrefs=True)
+        self._matcher = matcher
+        self._hrefs = OrderedDict()
+        self._new_hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value and value not in self._hrefs \
+                        and self._matcher.match(value.rsplit('/', 1)[-1]):
+                    self._hrefs[value] = None
+                    self._new_hrefs.append(value)
+
+    @property
+    def hrefs(self):
+        return list(self._hrefs)
+
+    def pop_new_hrefs(self):
+        result = self._new_hrefs
+        self._new_hrefs = []
+        return result
+
 
-        if link.has_attr('href'):
-            target_urls.append(link['href'])
+def iter_page_text(target_page):
+    decoder = codecs.getincrementaldecoder(target_page.encoding or 'utf-8')(errors='replace')
+    for chunk in target_page.iter_content(PAGE_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
 
-        result = set()
-        for target_url in target_urls:
-            for template in templates:
-                if fnmatch(target_url.rsplit('/', 1)[-1], template):
-                    result.add(target_url)
 
-    return list(result)
+def iter_urls_for_templates(target_page, templates):
+    """yield the links in a page matching any of templates as the page is downloaded"""
+
+    collector = HrefCollector(compile_templates(templates))
+    for text in iter_page_text(target_page):
+        collector.feed(text)
+        yield from collector.pop_new_hrefs()
+    collector.close()
+    yield from collector.pop_new_hrefs()
+
+
+def get_urls_for_templates(target_page, templates):
+    return list(iter_urls_for_templates(target_page, templates))
 
 
 def get_urls_from_args(root, target_urls):
@@ -58,25 +105,29 @@ class UrlNavigator(Navigator):
         return self._root
 
     def get_urls(self, sorted_by_version=True):
+        return list(self._iter_urls())
+
+    def iter_urls(self):
+        # navigators derived from this one that post process get_urls need all their urls at once
+        if type(self).get_urls is not UrlNavigator.get_urls:
+            yield from self.get_urls()
+        else:
+            yield from self._iter_urls()
+
+    def _iter_urls(self):
         target_args = self._args
 
-        result = []
         if target_args.form and target_args.root and not target_args.use_templates:
-            for target_url in target_args.urls:
-                result.append(target_url)
+            yield from target_args.urls
         elif target_args.root and not target_args.use_templates:
-            for target_url in get_urls_from_args(target_args.root, target_args.urls):
-                result.append(target_url)
+            yield from get_urls_from_args(target_args.root, target_args.urls)
         elif target_args.use_templates:
             page = transfer_page(self._target_session, target_args.root, target_args.password)
 
-            for target_url in get_urls_for_templates(page, target_args.urls):
-                result.append(target_url)
+            yield from iter_urls_for_templates(page, target_args.urls)
         else:
             print(f'Bad combination of template {target_args.use_templates} and root {target_args.root}')
 
-        return result
-
     def get_version(self, url):
         return None
 
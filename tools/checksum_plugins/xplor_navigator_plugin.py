@@ -1,7 +1,8 @@
+from collections import OrderedDict
 from fnmatch import fnmatch
-from functools import partial
 from pathlib import Path
-from urllib.parse import urlunparse, urlparse
+from threading import Lock
+from urllib.parse import urlparse
 import sys
 from html2text import html2text
 
@@ -77,14 +78,6 @@ def query_yes_no(question, default="yes"):
                              "(or 'y' or 'n').\n")
 
 
-def get_interpolated_url(root_url, button_value):
-    path = Path(root_url.path)
-    path = path.parent
-    path = path / button_value
-    return urlunparse(root_url._replace(path=str(path)))
-
-
-
 BUTTONS = 'buttons'
 EXTRA = 'extra'
 
@@ -99,14 +92,11 @@ class XplorNavigator(Navigator):
 
     def __init__(self, browser, target_args):
         super(XplorNavigator, self).__init__(browser, target_args)
-        # TODO: move to input args?
-        # if optimise is set to true read the url for the firdt button and extract the complete path and
-        # extrapolate the rest
-        self._optimise=True
         self._cache_data = {BUTTONS: {}, EXTRA: {}}
         self._urls = None
         self._target_url = None
         self._license_shown = False
+        self._license_lock = Lock()
 
 
     def login_with_form(self, target_url, username_password, form=None, verbose=0):
@@ -142,22 +132,14 @@ class XplorNavigator(Navigator):
             all_buttons = prototype_browser.get_current_page().find_all('input')
             all_button_names = [button['value'] for button in all_buttons]
 
-            raw_target_names = set()
-            for template in self._args.urls:
-                match = partial(fnmatch, pat=template)
-                raw_target_names.update(filter(match, all_button_names))
-
-
-            root_url = None
-            for target_index, button_value in enumerate(raw_target_names):
+            target_names = [button_name for button_name in all_button_names
+                            if any(fnmatch(button_name, template) for template in self._args.urls)]
+            target_names = list(OrderedDict.fromkeys(target_names))
 
-                if root_url:
-                    single_result = get_interpolated_url(root_url,button_value)
-                else:
-                    single_result = self._get_single_url(button_value)
+            for single_result in self._resolve_links(target_names, self._get_single_url):
 
-                if not root_url:
-                    root_url = urlparse(single_result)
+                if not single_result:
+                    continue
 
                 platform = self.get_platform(single_result)
                 if platform.lower() in IGNORED_PLATFORMS_LOWER:
@@ -165,7 +147,9 @@ class XplorNavigator(Navigator):
                     continue
                 result.append(single_result)
 
-        return result
+            self._urls = result
+
+        return self._urls
 
     @staticmethod
     def get_platform(url):
@@ -202,9 +186,30 @@ class XplorNavigator(Navigator):
 
     def _get_single_url(self, button_value):
 
+        browser = self._acquire_logged_in_browser()
+        try:
+            results = self._get_links_for_button(browser, button_value)
+        finally:
+            self._release_logged_in_browser(browser)
+
+        newline = '\n'
+        if len(results) == 0:
+            result = None
+        elif len(results) > 1:
+            msg = f'''Error: there should be one download link per link per url I got {len(results)}...
+                      {newline.join(results)}
+            '''
+            raise TooManyUrlsException(msg)
+        else:
+            result = results[0]
+
+        return result
+
+
+    def _get_links_for_button(self, browser, button_value):
+
         results = []
 
-        browser = self._re_login_with_form()
         form = browser.select_form(selector='form[method="POST"]', nr=3)
         button = browser.get_current_page().find('input', value=button_value)
         form.choose_submit(button)
@@ -213,34 +218,24 @@ class XplorNavigator(Navigator):
         if 'LICENSE FOR NON-PROFIT INSTITUTIONS TO USE XPLOR-NIH' not in page.get_text():
             print(f"WARNING: ignored the selection {button_value} as it wasn't found in the page", file=sys.stderr)
         else:
-            if not self._license_shown:
-                show_license(page)
-                self._license_shown=True
-                if not self._args.yes:
-                    if not query_yes_no('Do you accept the license?'):
-                        msg = 'License not accepted!'
-                        raise LicenseNotAcceptedException(msg)
-                    else:
-                        print()
+            # only show the license once and hold the other threads until it has been accepted
+            with self._license_lock:
+                if not self._license_shown:
+                    show_license(page)
+                    if not self._args.yes:
+                        if not query_yes_no('Do you accept the license?'):
+                            msg = 'License not accepted!'
+                            raise LicenseNotAcceptedException(msg)
+                        else:
+                            print()
+                    self._license_shown = True
             browser.select_form()
             browser.submit_selected()
 
             for link in browser.get_current_page().find_all('a'):
                 results.append(browser.absolute_url(link.get('href')))
 
-        newline = '\n'
-        if len(results) == 0:
-            result = None
-        elif len(results) > 1:
-            msg = f'''Error: there should be one download link per link per url I got {len(results)}...
-                      {newline.join(results)}
-            '''
-            raise TooManyUrlsException(msg)
-        else:
-            result = results[0]
-
-        return result
-
+        return results
 
     def get_package_info(self):
             return {
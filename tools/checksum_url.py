@@ -1,27 +1,38 @@
 import abc
-import copy
 import hashlib
-import json
+import random
 import re
-from collections import OrderedDict
-from pathlib import Path
+import socket
+from collections import OrderedDict, namedtuple
+from pathlib import Path, PurePosixPath
 from re import finditer
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 import sys
 from argparse import RawTextHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from threading import Event, Lock, Semaphore, Thread
 
-import yaml
-from html2text import html2text
-from mechanicalsoup import StatefulBrowser
-from time import sleep
+from time import sleep, perf_counter
+from functools import partial
 from tqdm import tqdm
 import os
 from plugins import load_and_register_factory_classes, list_navigators, list_outputs, get_navigator, get_output
-from cmp_version import VersionString
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse, quote
+from http import HTTPStatus
+from checksum_cache import JournalCache
+from download_store import DownloadStore, response_validators, conditional_headers, CONTENT_LENGTH
 
 CACHE_DATA = 'cache_data'
+VALIDATORS = 'validators'
+AUTH_SCHEMES = 'auth_schemes'
+URL_TEMPLATES = 'url_templates'
+NAVIGATOR_CACHE = 'navigator_cache'
+URL_TEMPLATE_NAME = '{name}'
 
 session = None
 
@@ -144,9 +155,17 @@ def get_failure_message(target_url, message):
 
 
 class DownloadFailedException(Exception):
-    def __init__(self, msg):
+    def __init__(self, msg, reason=None):
         super(DownloadFailedException, self).__init__(msg)
 
+        # the bare cause without terminal formatting for machine readable outputs
+        self.reason = reason if reason is not None else msg
+
+
+class DownloadCancelledException(DownloadFailedException):
+    def __init__(self, msg='download cancelled'):
+        super(DownloadCancelledException, self).__init__(msg)
+
 
 def display_text(text, header):
 
@@ -173,12 +192,19 @@ def display_text(text, header):
 
 
 def display_response(response, header='response'):
+    from html2text import html2text
+
     text = html2text(response.text)
     display_text(text, header)
 
 
 suffixes = ['B ', 'KB', 'MB', 'GB', 'TB', 'PB']
 
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+AUTO = 'auto'
+
 
 def human_size(number_bytes):
     index = 0
@@ -189,96 +215,438 @@ def human_size(number_bytes):
     return '%s %s' % (f, suffixes[index])
 
 
-def transfer_page(target_session, target_url, username_password=(None, None)):
+SUCCESSFUL_RESPONSES = HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT, HTTPStatus.NOT_MODIFIED
+
+# the number of urls per job that can be in the pipeline at once [being hashed or waiting for an earlier url]
+PENDING_PER_JOB = 4
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+                  HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT)
+
+
+class JitteredRetry(Retry):
+    """exponential backoff with jitter so concurrent workers that failed together don't all retry together"""
+
+    def get_backoff_time(self):
+        backoff = super(JitteredRetry, self).get_backoff_time()
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """an adapter whose sockets use tcp keep-alive so idle pooled connections to slow servers aren't dropped"""
+
+    SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15))
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + self.SOCKET_OPTIONS
+        super(KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+class ChecksumSession(requests.Session):
+    """a session that remembers which authentication scheme worked for each host"""
+
+    def __init__(self, auth_schemes=None):
+        super(ChecksumSession, self).__init__()
+        self.auth_schemes = dict(auth_schemes) if auth_schemes else {}
+        self.auths = {}
+        self.auth_lock = Lock()
+
+
+def create_session(pool_size=1, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, auth_schemes=None):
+    """a session shared by the navigators, transfer_page and the hashing workers, its connection pool is sized
+    for the number of workers and idempotent requests are retried on connection errors and transient 5xx"""
+
+    retry = JitteredRetry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                          status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    adapter = KeepAliveAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    result = ChecksumSession(auth_schemes)
+    result.mount('http://', adapter)
+    result.mount('https://', adapter)
+
+    return result
+
+
+BASIC = 'basic'
+DIGEST = 'digest'
+AUTH_CLASSES = {BASIC: requests.auth.HTTPBasicAuth, DIGEST: requests.auth.HTTPDigestAuth}
+
+
+def auth_scheme_from_challenge(response):
+    """the authentication scheme a server asked for in its WWW-Authenticate header if it is one we support"""
+    challenge = response.headers.get('www-authenticate', '').strip()
+    scheme = challenge.split(None, 1)[0].lower() if challenge else None
+    return scheme if scheme in AUTH_CLASSES else None
+
+
+def get_auth(target_session, host, scheme, username_password):
+    # one auth object is shared per host and scheme, a digest auth object keeps the server's nonce per thread so
+    # reusing it only saves the challenge round trip for later requests from the same worker, each worker's first
+    # request is still challenged
+    auths = getattr(target_session, 'auths', None)
+    key = host, scheme, username_password
+    if auths is None:
+        result = AUTH_CLASSES[scheme](*username_password)
+    else:
+        with target_session.auth_lock:
+            result = auths.setdefault(key, AUTH_CLASSES[scheme](*username_password))
+    return result
+
+
+def transfer_page(target_session, target_url, username_password=(None, None), headers=None, method='GET'):
     if username_password != (None, None):
-        username, password = username_password
+        host = urlparse(target_url).netloc
+        auth_schemes = getattr(target_session, 'auth_schemes', {})
+
+        known_scheme = auth_schemes.get(host)
+        scheme = known_scheme if known_scheme else BASIC
+
+        auth = get_auth(target_session, host, scheme, username_password)
+        response = target_session.request(method, target_url, allow_redirects=True, timeout=10, stream=True,
+                                          auth=auth, headers=headers)
+
+        if response.status_code not in SUCCESSFUL_RESPONSES:
+            # use the scheme the server asked for, if it didn't say and we haven't succeeded on this host before
+            # fall back to guessing digest
+            challenged_scheme = auth_scheme_from_challenge(response)
+            if challenged_scheme and challenged_scheme != scheme:
+                retry_scheme = challenged_scheme
+            elif not challenged_scheme and not known_scheme and scheme != DIGEST:
+                retry_scheme = DIGEST
+            else:
+                retry_scheme = None
 
-        auth = requests.auth.HTTPBasicAuth(username, password)
-        response = target_session.get(target_url, allow_redirects=True, timeout=10, stream=True, auth=auth)
+            # a scheme the server asked for is recorded straight away so other workers don't try basic first
+            if challenged_scheme:
+                auth_schemes[host] = challenged_scheme
 
-        if response.status_code != 200:
-            auth = requests.auth.HTTPDigestAuth(username, password)
-            response = target_session.get(target_url, allow_redirects=True, timeout=10, stream=True, auth=auth)
+            if retry_scheme:
+                response.close()
+                scheme = retry_scheme
+                auth = get_auth(target_session, host, scheme, username_password)
+                response = target_session.request(method, target_url, allow_redirects=True, timeout=10, stream=True,
+                                                  auth=auth, headers=headers)
+
+        if response.status_code in SUCCESSFUL_RESPONSES:
+            auth_schemes[host] = scheme
 
     else:
-        response = target_session.get(target_url, allow_redirects=True, timeout=10, stream=True)
+        response = target_session.request(method, target_url, allow_redirects=True, timeout=10, stream=True,
+                                          headers=headers)
     return response
 
 
-def get_hash_from_file(path,digest='sha256'):
-    digester_factory = getattr(hashlib, digest)
-    digester = digester_factory()
+class MultiDigester:
+    """feed the same stream of chunks to several hash algorithms so the data only has to be read once"""
+
+    def __init__(self, digests=('sha256',)):
+        self._digesters = OrderedDict((digest, hashlib.new(digest)) for digest in digests)
+
+    def update(self, data):
+        for digester in self._digesters.values():
+            digester.update(data)
+
+    def hexdigests(self):
+        return OrderedDict((digest, digester.hexdigest()) for digest, digester in self._digesters.items())
+
+
+def create_progress_bar(count, total_data_length=None, position=None, initial=0):
+    """a percentage bar if the length of the data is known, otherwise a running count of the bytes read"""
+    if total_data_length is not None:
+        human = human_size(total_data_length)
+        bar_length = 80 - 56
+        bar_format = f'Reading {count} {human} {{l_bar}}{{bar:{bar_length}}} [remaining time: {{remaining}}]'
+        result = tqdm(total=total_data_length, bar_format=bar_format, file=sys.stderr, leave=False,
+                      position=position, initial=initial)
+    else:
+        bar_format = f'Reading {count} {{n_fmt}}B of unknown length [{{rate_fmt}}]'
+        result = tqdm(total=None, bar_format=bar_format, file=sys.stderr, leave=False, position=position,
+                      unit='B', unit_scale=True, unit_divisor=1024, initial=initial)
+    return result
+
+
+def close_progress_bar(progress_bar, count, position=None):
+    progress_bar.close()
+    if position is None:
+        print(f'Reading {count} {human_size(progress_bar.n)} done!', file=sys.stderr, end='')
+
+
+class AdaptiveChunkSize:
+    """choose how much to read per call from the measured bandwidth: reads that fill the chunk quickly double it
+    [up to maximum] and slow reads halve it [down to minimum] so fast links make few python calls per GB while
+    slow links still update the progress bar regularly"""
+
+    FAST_READ_TIME = 0.05
+    SLOW_READ_TIME = 1.0
+
+    def __init__(self, minimum=MIN_CHUNK_SIZE, maximum=MAX_CHUNK_SIZE):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = minimum
+
+    def update(self, num_read, elapsed):
+        if num_read == self.size and elapsed < self.FAST_READ_TIME:
+            self.size = min(self.size * 2, self.maximum)
+        elif elapsed > self.SLOW_READ_TIME:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def hash_from_readinto(readinto, digester, buffer_size=DEFAULT_BUFFER_SIZE, progress_bar=None, stop_event=None,
+                       max_buffer_size=None):
+    """hash a stream by reading it into a single reused buffer so memory use is independent of its length
+
+    readinto is a callable in the style of io.RawIOBase.readinto, returning the number of bytes read and 0 at
+    the end of the stream, if max_buffer_size is given the size of each read adapts between buffer_size and
+    max_buffer_size
+    """
+
+    chunk_size = AdaptiveChunkSize(buffer_size, max_buffer_size if max_buffer_size else buffer_size)
+
+    buffer = bytearray(chunk_size.maximum)
+    view = memoryview(buffer)
+
+    while True:
+        if stop_event and stop_event.is_set():
+            raise DownloadCancelledException()
+
+        start = perf_counter()
+        num_read = readinto(view[:chunk_size.size])
+        if not num_read:
+            break
+        chunk_size.update(num_read, perf_counter() - start)
+
+        digester.update(view[:num_read])
+        if progress_bar is not None:
+            progress_bar.update(num_read)
+
+
+def digest_file(path, digester, buffer_size=DEFAULT_BUFFER_SIZE, progress_bar=None, stop_event=None):
+    with open(path, 'rb', buffering=0) as fh:
+        hash_from_readinto(fh.readinto, digester, buffer_size, progress_bar, stop_event)
+
+
+def get_hash_from_file(path, digests=('sha256',), verbose=0, count='', buffer_size=DEFAULT_BUFFER_SIZE,
+                       position=None, stop_event=None):
+
+    show_progress = verbose > 0
+
+    digester = MultiDigester(digests)
+
+    progress_bar = create_progress_bar(count, os.path.getsize(path), position) if show_progress else None
+    try:
+        digest_file(path, digester, buffer_size, progress_bar, stop_event)
+    except DownloadCancelledException:
+        if progress_bar is not None:
+            progress_bar.close()
+        raise
+
+    if progress_bar is not None:
+        close_progress_bar(progress_bar, count, position)
+
+    return digester.hexdigests()
+
+def chunk_size_range(chunk_size=AUTO):
+    """the minimum and maximum read sizes for downloads, auto adapts between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE"""
+    if chunk_size == AUTO:
+        result = MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+    else:
+        result = chunk_size, chunk_size
+    return result
+
+
+# the digests of a download and the headers that identify the version of the file that was downloaded,
+# digests is None if the server reported that the file hasn't changed since validators were recorded
+HashResult = namedtuple('HashResult', 'digests validators'.split())
+
+
+def cache_validators(response):
+    result = response_validators(response)
+    content_length = response.headers.get('content-length')
+    if response.status_code == HTTPStatus.OK and content_length is not None:
+        result[CONTENT_LENGTH] = int(content_length)
+    return result
 
-    with open(path, 'rb') as fh:
-        digester.update(fh.read())
 
-    return digester.hexdigest(), digester.name
+def validators_match(cached, current):
+    """true if a server that ignored a conditional request still describes the same file that was cached"""
+    result = False
+    if cached and current:
+        keys = set(cached) & set(current)
+        result = keys != {CONTENT_LENGTH} and len(keys) > 0 and all(cached[key] == current[key] for key in keys)
+    return result
 
-def get_hash_from_url(target_url, target_session, verbose, count, digest='sha256',
-                      username_password=(None, None), debug=False):
+
+def get_hash_from_url(target_url, target_session, verbose, count, digests=('sha256',),
+                      username_password=(None, None), debug=False, position=None, stop_event=None,
+                      chunk_size=AUTO, store=None, validators=None):
 
     show_progress = verbose > 0
 
-    digester_factory = getattr(hashlib, digest)
-    digester = digester_factory()
+    digester = MultiDigester(digests)
 
+    result = None
     if not debug:
-        response = transfer_page(target_session, target_url, username_password)
+        entry = store.entry(target_url) if store else None
+        request_headers = entry.request_headers() if entry else None
+        if not request_headers and validators:
+            request_headers = conditional_headers(validators)
+
+        response = transfer_page(target_session, target_url, username_password, headers=request_headers)
+
+        # a range the server can't serve or one that doesn't continue the part file means starting again
+        range_failed = entry and (response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE or
+                                  (response.status_code == HTTPStatus.PARTIAL_CONTENT and
+                                   not entry.resumes_part(response)))
+        if range_failed:
+            response.close()
+            entry.discard_part()
+            response = transfer_page(target_session, target_url, username_password)
 
         total_data_length = response.headers.get('content-length')
 
-        bar_length = 80 - 56
+        current_validators = cache_validators(response)
+        unchanged = response.status_code == HTTPStatus.NOT_MODIFIED or \
+            (response.status_code == HTTPStatus.OK and validators_match(validators, current_validators))
 
         t = None
-        if response.status_code != 200:
-            raise DownloadFailedException(f"download failed [response was {response.status_code}]")
-        elif total_data_length is None:
-            digester.update(response.content)
+        file_handle = None
+        if entry and entry.is_current(response):
+            # the stored copy is still current, reuse its bytes rather than downloading them again
+            response.close()
+            hexdigests = entry.digests(digests)
+            if hexdigests is None:
+                min_chunk_size, _ = chunk_size_range(chunk_size)
+                hexdigests = get_hash_from_file(entry.data_path, digests, verbose, count, min_chunk_size, position,
+                                                stop_event)
+                entry.record_digests(hexdigests)
+            result = HashResult(hexdigests, {**entry.validators, CONTENT_LENGTH: entry.meta[CONTENT_LENGTH]})
+
+        elif unchanged and validators:
+            # the cached digests are still current and no body has to be transferred
+            response.close()
+            result = HashResult(None, {**validators, **current_validators})
+
+        elif response.status_code not in (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT):
+            reason = f'response was {response.status_code}'
+            raise DownloadFailedException(f"download failed [{reason}]", reason)
+
         else:
             try:
-                total_data_length = int(total_data_length)
+                # some servers don't send a content-length, the data is still streamed so memory use is bounded
+                if total_data_length is not None:
+                    total_data_length = int(total_data_length)
+
+                min_chunk_size, max_chunk_size = chunk_size_range(chunk_size)
+
+                sink = digester
+                initial = 0
+                if entry:
+                    hash_existing = partial(digest_file, buffer_size=min_chunk_size, stop_event=stop_event)
+                    file_handle, sink = entry.open_writer(response, digester, hash_existing)
+                    if response.status_code == HTTPStatus.PARTIAL_CONTENT:
+                        initial = entry.part_size()
+                        total_data_length = initial + total_data_length if total_data_length is not None else None
 
-                human = human_size(total_data_length)
                 if show_progress:
-                    bar_format = f'Reading {count} {human} {{l_bar}}{{bar:{bar_length}}} [remaining time: {{remaining}}]'
-                    t = tqdm(total=total_data_length, bar_format=bar_format, file=sys.stderr, leave=False)
+                    t = create_progress_bar(count, total_data_length, position, initial)
 
-                for data in response.iter_content(chunk_size=4096):
-                    if show_progress:
-                        t.update(len(data))
-                    digester.update(data)
+                # read straight into a reused buffer rather than allocating a new bytes object per chunk, the raw
+                # stream still has to undo any content-encoding in the same way iter_content does
+                response.raw.decode_content = True
+                hash_from_readinto(response.raw.readinto, sink, min_chunk_size, t, stop_event, max_chunk_size)
 
                 if show_progress:
-                    t.close()
-                    print(f'Reading {count} {human} done!', file=sys.stderr, end='')
+                    close_progress_bar(t, count, position)
 
+            except DownloadCancelledException:
+                if t is not None:
+                    t.close()
+                raise
             except Exception as exception:
-                raise DownloadFailedException(get_failure_message(target_url, exception_to_message(exception)))
+                message = exception_to_message(exception)
+                raise DownloadFailedException(get_failure_message(target_url, message), str(exception) or message)
+            finally:
+                if file_handle:
+                    file_handle.close()
+
+            result = HashResult(digester.hexdigests(), current_validators)
+            if entry:
+                entry.commit(result.digests)
     else:
-        digester.update(url.encode('utf8'))
+        digester.update(target_url.encode('utf8'))
+        result = HashResult(digester.hexdigests(), {})
 
-    return digester.hexdigest(), digester.name
+    return result
 
 
+def calculate_hash(url, navigator, target_session, target_args, count, progress_positions=None, stop_event=None,
+                   store=None, validators=None):
+    """calculate the hash of a url or local file, this is run on a worker thread when --jobs > 1"""
+
+    position = progress_positions.get() if progress_positions else None
+    try:
+        if is_url(url):
+            specific_url = navigator.login_and_get_url(url)
+            result = get_hash_from_url(specific_url, target_session, target_args.verbose, count,
+                                       digests=target_args.digests, username_password=target_args.password,
+                                       debug=target_args.debug, position=position, stop_event=stop_event,
+                                       chunk_size=target_args.chunk_size, store=store, validators=validators)
+        else:
+            file_name = os.path.expanduser(url)
+            exit_if_file_doesnt_exist(file_name)
+            hexdigests = get_hash_from_file(file_name, digests=target_args.digests, verbose=target_args.verbose,
+                                            count=count, buffer_size=target_args.buffer_size, position=position,
+                                            stop_event=stop_event)
+            result = HashResult(hexdigests, {})
+    finally:
+        if progress_positions:
+            progress_positions.put(position)
+
+    return result
+
+
+def create_progress_positions(jobs):
+    """a pool of tqdm bar positions so each concurrent download gets its own line, None when serial"""
+    result = None
+    if jobs > 1:
+        result = Queue()
+        for position in range(jobs):
+            result.put(position)
+    return result
+
+
+
+def line_start(stream=None):
+    """a carriage return to write over a progress bar on a terminal, nothing when output is going to a file or pipe
+    where it would just be noise"""
+    stream = sys.stdout if stream is None else stream
+    return '\r' if stream.isatty() else ''
+
 
 def report_error(target_url, error, url_length, index):
     msg = " ".join(error.args)
     target_url = target_url.ljust(url_length)
     index_string = f'[{index}]'.ljust(5)
-    sys.stdout.write(f"\rsum {index_string} {target_url} {msg}")
+    sys.stdout.write(f"{line_start()}sum {index_string} {target_url} {msg}\n")
 
 
 def exit_if_asked():
 
     print()
-    print('exiting...', file=sys.stder)
+    print('exiting...', file=sys.stderr)
     sys.exit(1)
 
 
 def display_hash(target_url, _hash, url_field_length, index):
     target_url = target_url.ljust(url_field_length)
     index_string = f'[{index}]'.ljust(5)
-    sys.stdout.write(f"\rsum {index_string} {target_url} {_hash}")
+    sys.stdout.write(f"{line_start()}sum {index_string} {target_url} {_hash}")
 
 
 def chunks(lst, n):
@@ -290,6 +658,65 @@ def chunks(lst, n):
 NEW_LINE = '\n'
 
 
+def size_in_bytes(value):
+    """parse a size in bytes with an optional K, M or G suffix [binary multiples] e.g. 64K or 4M"""
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+    value = value.strip().upper().rstrip('B')
+    multiplier = 1
+    if value and value[-1] in multipliers:
+        multiplier = multipliers[value[-1]]
+        value = value[:-1]
+
+    try:
+        result = int(value) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected a size in bytes e.g. 65536, 64K or 4M, got {value}')
+
+    if result < 1:
+        raise argparse.ArgumentTypeError(f'expected a size of at least 1 byte, got {value}')
+
+    return result
+
+
+def chunk_size_or_auto(value):
+    return AUTO if value.strip().lower() == AUTO else size_in_bytes(value)
+
+
+def positive_int(value):
+    result = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f'expected an integer >= 1, got {value}')
+    return result
+
+
+def non_negative_int(value):
+    result = int(value)
+    if result < 0:
+        raise argparse.ArgumentTypeError(f'expected an integer >= 0, got {value}')
+    return result
+
+
+def digest_list(value):
+    """parse a comma separated list of digest algorithm names e.g. md5,sha256,sha512"""
+    result = []
+    for digest in value.split(','):
+        digest = digest.strip().lower()
+        if not digest:
+            continue
+        try:
+            test_hash_length(lambda: hashlib.new(digest))
+        except (ValueError, TypeError):
+            raise argparse.ArgumentTypeError(f'unknown or unsupported digest algorithm {digest}')
+        if digest not in result:
+            result.append(digest)
+
+    if not result:
+        raise argparse.ArgumentTypeError('at least one digest algorithm is required')
+
+    return result
+
+
 def digests_formatted():
     digests = list(chunks(list(hashlib.algorithms_available), 5))
     digests = [', '.join(group) for group in digests]
@@ -337,12 +764,26 @@ class NavigatorABC(abc.ABC):
     def have_cache(self):
         return False
 
-    def get_cache_data(self, type, url):
+    def get_cache_data(self, url):
         return {}
 
     def set_cache_data(self, url, data):
         ...
 
+    def get_upstream_digests(self, url):
+        """digests for a url published by the site it comes from, used instead of downloading with --trust-upstream"""
+        return {}
+
+    def get_upstream_size(self, url):
+        return None
+
+    def get_navigator_cache_data(self):
+        """data the navigator wants to keep between runs that isn't about a single url"""
+        return {}
+
+    def set_navigator_cache_data(self, data):
+        ...
+
     def camel_case_to_spaced(self, name):
         name = re.sub(r'(?<!^)(?=[A-Z])', ' ', name)
         return name
@@ -365,15 +806,40 @@ class Navigator(NavigatorABC):
 
     def __init__(self, target_session, target_args):
         self._target_session = target_session
-        self._browser = StatefulBrowser(session=target_session)
+        self.__browser = None
         self._args = target_args
         self._target_url = None
         self._username_password = None
         self._form = None
+        self._logged_in_page = None
+        self._browser_pool = Queue()
+
+        # with optimise set urls are extrapolated from a url template learned from one link, else every link is
+        # resolved [using up to jobs threads]
+        self._optimise = getattr(target_args, 'optimise', True)
+        self._jobs = getattr(target_args, 'jobs', 1)
+        self._url_templates = {}
+
+    @property
+    def _browser(self):
+        # mechanicalsoup [and beautiful soup] are only imported by navigators that need a browser
+        if self.__browser is None:
+            self.__browser = self._create_browser()
+        return self.__browser
+
+    def _create_browser(self):
+        from mechanicalsoup import StatefulBrowser
+
+        return StatefulBrowser(session=self._target_session)
 
     def get_urls(self, sorted_by_version=True):
         raise Exception('Error: please implement get_urls')
 
+    def iter_urls(self):
+        """yield the urls as they are found so hashing can start before the navigator has finished, navigators that
+        can't stream their urls just yield the result of get_urls"""
+        yield from self.get_urls()
+
     @classmethod
     def _sort_url_versions(cls, url_versions):
         return cls._sort_by_version(url_versions)
@@ -420,17 +886,93 @@ class Navigator(NavigatorABC):
 
         self._do_login(browser, target_url, username_password, form, verbose)
 
+        self._logged_in_page = str(browser.page), browser.url
+
     def _re_login_with_form(self):
 
-        browser = StatefulBrowser(session=self._target_session)
+        browser = self._create_browser()
 
         self._do_login(browser, self._target_url, self._username_password, self._form)
 
         return browser
 
+    def _acquire_logged_in_browser(self):
+        """a logged in browser for use by one thread, browsers are reused once released and are put back on the page
+        shown after logging in rather than logging in again [the login is held by the shared session]"""
+        try:
+            browser = self._browser_pool.get_nowait()
+            page, url = self._logged_in_page
+            browser.open_fake_page(page, url)
+        except Empty:
+            browser = self._re_login_with_form()
+
+        return browser
+
+    def _release_logged_in_browser(self, browser):
+        self._browser_pool.put(browser)
+
+    def get_url_templates(self):
+        return self._url_templates
+
+    def set_url_templates(self, url_templates):
+        self._url_templates = dict(url_templates)
+
+    def _link_exists(self, url):
+        try:
+            response = transfer_page(self._target_session, url, self._username_password or (None, None),
+                                     method='HEAD')
+            response.close()
+            result = response.status_code == HTTPStatus.OK
+        except requests.RequestException:
+            result = False
+        return result
+
+    def _resolve_links(self, names, resolve_link):
+        """resolve link names to download urls using resolve_link(name) [usually a walk through the site's forms],
+        if optimise is set urls are first guessed from the url template learned from an earlier link and confirmed
+        with a HEAD request, so a link is only walked when no template fits it"""
+
+        if not self._optimise:
+            with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                return list(executor.map(resolve_link, names))
+
+        result = OrderedDict.fromkeys(names)
+        pending = list(names)
+        tried_templates = set()
+        learned_template = False
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            while pending:
+                template = self._url_templates.get(self._target_url)
+                if template and template not in tried_templates:
+                    tried_templates.add(template)
+                    guesses = [url_from_template(template, name) for name in pending]
+                    for name, guess, exists in zip(pending, guesses, executor.map(self._link_exists, guesses)):
+                        if exists:
+                            result[name] = guess
+                    pending = [name for name in pending if result[name] is None]
+
+                elif not learned_template:
+                    # walk a single link to learn a template for the rest
+                    learned_template = True
+                    name = pending.pop(0)
+                    url = resolve_link(name)
+                    result[name] = url
+                    if url:
+                        self._url_templates[self._target_url] = url_template_from_link(name, url)
+
+                else:
+                    # no template fits the remaining links so they are all walked, as without optimise
+                    for name, url in zip(pending, executor.map(resolve_link, pending)):
+                        result[name] = url
+                    pending = []
+
+        return list(result.values())
+
     @classmethod
     def inverted_sort_dict(cls, dict_to_sort, reverse_sorted=True):
 
+        from cmp_version import VersionString
+
         inverted = [(value, key) for key, value in dict_to_sort.items()]
         inverted.sort(key=lambda x: VersionString(x[0]), reverse=reverse_sorted)
 
@@ -533,6 +1075,25 @@ def get_max_string_length(in_urls):
     return result
 
 
+def url_template_from_link(name, url):
+    """a template for the urls of a site's other links learned from the name of one link and the url it resolved to,
+    the name is replaced by a placeholder if it appears in the path else the last part of the path is replaced"""
+    parsed_url = urlparse(url)
+    quoted_name = quote(name)
+
+    if quoted_name in parsed_url.path:
+        head, _, tail = parsed_url.path.rpartition(quoted_name)
+        path = head + URL_TEMPLATE_NAME + tail
+    else:
+        path = str(PurePosixPath(parsed_url.path).parent / URL_TEMPLATE_NAME)
+
+    return urlunparse(parsed_url._replace(path=path))
+
+
+def url_from_template(template, name):
+    return template.replace(URL_TEMPLATE_NAME, quote(name))
+
+
 def is_url(url):
     try:
         result = urlparse(url)
@@ -541,46 +1102,381 @@ def is_url(url):
         result = False
     return result
 
+# when an output flushes what it has written: after every result, only at the end or after every result if an
+# incremental output is being piped to another program [where it would otherwise be block buffered]
+FLUSH_RESULT = 'result'
+FLUSH_END = 'end'
+FLUSH_POLICIES = (AUTO, FLUSH_RESULT, FLUSH_END)
+
+
 class OutputBase:
 
+    # outputs that write each result as it arrives [rather than everything in finish] set this
+    INCREMENTAL = False
+
+    # outputs meant to be read by other programs set this so nothing but their records is written to stdout
+    MACHINE_READABLE = False
+
     def __init__(self, target_args):
         self._target_args = target_args
         self.digest = 'unknown'
+        self.digests = []
+        self._stream = sys.stdout
+        self._flush_policy = getattr(target_args, 'flush', AUTO)
 
     def output(self, url, hash, max_length_url, i):
         """output a url and its hash"""
 
+    def on_result(self, target_url, digests, url_field_length, index, num_urls=None, extra_info=None):
+        """called with the digests of each url as soon as it and all the urls before it are done"""
+        self.display_hash(target_url, digests, url_field_length, index, num_urls)
+        self._flush_if_needed()
+
+    def on_error(self, target_url, error, url_field_length, index):
+        """called in place of on_result when a url couldn't be hashed"""
+        report_error(target_url, error, url_field_length, index)
+        self._flush_if_needed()
+
+    def _flush_if_needed(self):
+        if self._flush_policy == FLUSH_RESULT:
+            flush = True
+        elif self._flush_policy == AUTO:
+            flush = self.INCREMENTAL and not self._stream.isatty()
+        else:
+            flush = False
+
+        if flush:
+            self._stream.flush()
+
 
 def cache_file_exists(file_name):
     return Path(file_name).is_file()
 
 
-def load_cache_file(file_name):
-    try:
-        with open(file_name) as file_h:
-            result = yaml.safe_load(file_h)
-    except IOError as err:
-        print(f'WARNING: cache file {file_name} can be opened {err} ignored!', file=sys.stderr)
+def select_urls_to_verify(url_sizes, sample_size=None, max_size=None):
+    """choose which urls with trusted upstream digests are downloaded and hashed anyway: those no larger than
+    max_size [urls of unknown size are skipped] and from them a random sample of sample_size urls, if neither limit
+    is given no urls are verified"""
+
+    result = []
+    if sample_size is not None or max_size is not None:
+        result = [url for url, size in url_sizes.items()
+                  if max_size is None or (size is not None and size <= max_size)]
+
+        if sample_size is not None and sample_size < len(result):
+            result = random.sample(result, sample_size)
+
+    return set(result)
+
+
+class OrderedResults:
+    """hold results that complete out of order until all the results before them have been emitted"""
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._next_index = 0
+        self._waiting = {}
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def add(self, index, result):
+        self._waiting[index] = result
+        while self._next_index in self._waiting:
+            self._emit(self._next_index, self._waiting.pop(self._next_index))
+            self._next_index += 1
+
+    def flush(self):
+        """emit all the waiting results in order without waiting for the missing results before them"""
+        for index in sorted(self._waiting):
+            self._emit(index, self._waiting.pop(index))
+            self._next_index = index + 1
+
+
+HashJob = namedtuple('HashJob', 'index url version validators upstream_digests verify')
+
+
+# events passed to the main thread of a ChecksumPipeline
+URL_FOUND = 'url_found'
+URLS_FINISHED = 'urls_finished'
+NAVIGATOR_FAILED = 'navigator_failed'
+HASH_DONE = 'hash_done'
+
+
+class ChecksumPipeline:
+    """hash the urls yielded by a navigator as they are found and pass the results to the output in order as soon as
+    they and every url before them are ready
+
+    the navigator runs on its own thread and is held back once PENDING_PER_JOB * jobs urls are in the pipeline
+    [being hashed or waiting for an earlier url to finish] so memory stays bounded however many urls there are, cached
+    and trusted upstream digests go straight to the output while other urls are hashed by --jobs threads"""
+
+    def __init__(self, navigator, session, out, args, cache, store, notes):
+        self._navigator = navigator
+        self._session = session
+        self._out = out
+        self._args = args
+        self._cache = cache
+        self._store = store
+        self._notes = notes
+
+        self._pending = Semaphore(PENDING_PER_JOB * args.jobs)
+        self._progress_positions = create_progress_positions(args.jobs)
+        self._stop_event = Event()
+
+        self._num_urls = None
+        self._url_field_length = 0
+        self._urls_to_verify = None
+        self._results = OrderedResults(self._emit)
+        self._failed = False
+
+        self.version_info = OrderedDict()
+
+    def _upstream_digests(self, url):
         result = None
-    return result
+        if self._args.trust_upstream:
+            url_digests = self._navigator.get_upstream_digests(url)
+            if all(digest in url_digests for digest in self._args.digests):
+                result = OrderedDict((digest, url_digests[digest]) for digest in self._args.digests)
+        return result
+
+    def _prepare(self, urls):
+        """a fixed list of urls has a known length and field width, urls yielded by a navigator are used as they
+        come unless they all have to be seen first to choose a random sample to verify"""
+
+        if self._args.trust_upstream and self._args.verify_sample is not None:
+            urls = list(urls)
+            url_sizes = {url: self._navigator.get_upstream_size(url) for url in urls if self._upstream_digests(url)}
+            self._urls_to_verify = select_urls_to_verify(url_sizes, self._args.verify_sample,
+                                                         self._args.verify_max_size)
+
+        if isinstance(urls, list):
+            self._num_urls = len(urls)
+            self._url_field_length = get_max_string_length(urls)
+
+        return urls
+
+    def _should_verify(self, url):
+        if self._urls_to_verify is not None:
+            result = url in self._urls_to_verify
+        else:
+            url_sizes = {url: self._navigator.get_upstream_size(url)}
+            result = bool(select_urls_to_verify(url_sizes, None, self._args.verify_max_size))
+        return result
+
+    def _cached_digests(self, url):
+        return OrderedDict((digest, self._cache[url][DIGESTS][digest]) for digest in self._args.digests)
+
+    def _create_job(self, index, url):
+        """a job to hash url or None if its digests are already known, in which case they are passed to the output"""
+
+        cache = self._cache
+        navigator = self._navigator
+        verbose = self._args.verbose
+
+        version = navigator.get_version(url)
+
+        if not navigator.have_cache():
+            if verbose >=2:
+                print(f"NOTE: cache requested but the navigator {navigator.name()} doesn't support caching", file=sys.stderr)
+            have_cache = False
+        elif cache != None and url in cache:
+            have_cache = all(digest in cache[url][DIGESTS] for digest in self._args.digests)
+        else:
+            have_cache = False
+
+        # digests cached with the headers that identify the file are checked with a conditional request
+        validators = None
+        if have_cache and self._args.revalidate and is_url(url):
+            validators = cache[url].get(VALIDATORS)
+
+        upstream_digests = self._upstream_digests(url)
+        verify = upstream_digests is not None and self._should_verify(url)
+
+        result = None
+        if have_cache and not validators:
+            navigator.set_cache_data(url, cache[url][CACHE_DATA])
+            self._results.add(index, (url, self._cached_digests(url), None))
+
+            if verbose >=1:
+                self._notes.append(f"NOTE: using cached data for {url} [version: {version}]")
+        elif upstream_digests is not None and not verify:
+            self._results.add(index, (url, upstream_digests, None))
+
+            if verbose >=1:
+                self._notes.append(f"NOTE: using upstream digests for {url} [version: {version}]")
+        else:
+            result = HashJob(index, url, version, validators, upstream_digests, verify)
+
+        return result
+
+    def _submit(self, executor, job):
+        num_urls = self._num_urls if self._num_urls is not None else '?'
+        x_of_y = '%3i/%-3s' % (job.index + 1, num_urls)
+        return executor.submit(calculate_hash, job.url, self._navigator, self._session, self._args, x_of_y,
+                               self._progress_positions, self._stop_event, self._store, job.validators)
+
+    def _complete(self, job, future):
+        cache = self._cache
+        navigator = self._navigator
+        notes = self._notes
+        verbose = self._args.verbose
+        url, version, validators = job.url, job.version, job.validators
+
+        try:
+            digests, current_validators = future.result()
+
+            if digests is None:
+                digests = self._cached_digests(url)
+                navigator.set_cache_data(url, cache[url][CACHE_DATA])
+                if cache[url].get(VALIDATORS) != current_validators:
+                    cache[url][VALIDATORS] = current_validators
+                    commit_to_cache(cache, url, notes)
+
+                if verbose >=1:
+                    notes.append(f"NOTE: using revalidated cached data for {url} [version: {version}]")
+
+            else:
+                if job.verify:
+                    for digest, upstream_digest in job.upstream_digests.items():
+                        if digests[digest] != upstream_digest:
+                            notes.append(f"WARNING: the {digest} of {url} doesn't match the one published upstream "
+                                         f"[{upstream_digest}], the calculated digest will be used")
+                        elif verbose >= 1:
+                            notes.append(f"NOTE: verified the upstream {digest} of {url}")
+
+                if cache != None  and navigator.have_cache():
+                    if validators:
+                        notes.append(f"NOTE: {url} changed since it was cached, rehashed [version: {version}]")
+                    elif verbose>=1:
+                        notes.append(f"NOTE: creating cached data for {url} [version: {version}]")
+                    cache_entry = cache.setdefault(url, {})
+                    if validators:
+                        cache_entry[DIGESTS] = {}
+                    cache_entry.setdefault(DIGESTS, {}).update(digests)
+                    cache_entry[CACHE_DATA] = navigator.get_cache_data(url)
+                    if current_validators:
+                        cache_entry[VALIDATORS] = current_validators
+                    commit_to_cache(cache, url, notes)
+
+            self._results.add(job.index, (url, digests, None))
+
+        except DownloadCancelledException:
+            self._results.add(job.index, (url, None, None))
+
+        except DownloadFailedException as e:
+
+            self._results.add(job.index, (url, None, e))
+
+            if self._args.fail_early:
+                self._failed = True
+
+    def _stop_early(self, futures, executor):
+        """stop after a failure with --fail-early, the urls that finished hashing are written in order with it"""
+
+        self._stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+        for future, job in futures.items():
+            if not future.cancelled() and future.exception() is None:
+                self._complete(job, future)
+
+        self._results.flush()
+        exit_if_asked()
+
+    def _emit(self, index, result):
+        self._pending.release()
+
+        url, digests, error = result
+        if error is not None:
+            self._out.on_error(url, error, self._url_field_length, index + 1)
+        elif digests is not None:
+            extra_info = self._navigator.get_extra_info(url)
+            self.version_info[url] = extra_info
+            self._out.on_result(url, digests, self._url_field_length, index + 1, self._num_urls, extra_info)
+
+    def _produce(self, urls, events):
+        try:
+            for index, url in enumerate(urls):
+                self._pending.acquire()
+                events.put((URL_FOUND, index, url))
+        except BaseException as e:
+            events.put((NAVIGATOR_FAILED, e, None))
+        else:
+            events.put((URLS_FINISHED, None, None))
+
+    def run(self, urls):
+        urls = self._prepare(urls)
+
+        # the navigator thread and finished hashes report to this thread through a single queue of events
+        events = Queue()
+        Thread(target=self._produce, args=(urls, events), daemon=True).start()
+
+        with ThreadPoolExecutor(max_workers=self._args.jobs) as executor:
+            try:
+                self._run_events(events, executor)
+            except KeyboardInterrupt:
+                # stop the downloads in progress rather than waiting for them to finish
+                self._stop_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def _run_events(self, events, executor):
+        futures = {}
+        urls_finished = False
+        while not urls_finished or futures:
+            event, first, second = events.get()
+
+            if event == URL_FOUND:
+                index, url = first, second
+                self._url_field_length = max(self._url_field_length, len(url))
+
+                job = self._create_job(index, url)
+                if job:
+                    future = self._submit(executor, job)
+                    futures[future] = job
+                    future.add_done_callback(lambda done: events.put((HASH_DONE, done, None)))
+
+            elif event == HASH_DONE:
+                future = first
+                self._complete(futures.pop(future), future)
+
+                if self._failed:
+                    self._stop_early(futures, executor)
+
+            elif event == NAVIGATOR_FAILED:
+                self._stop_event.set()
+                raise first
+
+            else:
+                urls_finished = True
 
 
 def get_cache(cache_file_name, notes):
     if args.cache_file:
         if cache_file_exists(cache_file_name):
-            result = load_cache_file(cache_file_name)
             if verbose:
                 notes.append(f"NOTE: using cache file {cache_file_name}")
-
         else:
             notes.append(f"NOTE: cache file {cache_file_name} doesn't exists creating a new one...")
-            result = {}
+        result = JournalCache(cache_file_name)
+        if str(result.journal_path) != str(cache_file_name):
+            notes.append(f'NOTE: cache file {cache_file_name} is read but not changed, new values are saved in '
+                         f'{result.journal_path}')
     else:
         result = None
 
     return result
 
-def get_package_from_cache(cache, navigator):
+
+def commit_to_cache(cache, key, notes):
+    try:
+        cache.commit(key)
+    except IOError as err:
+        notes.append(f'NOTE: failed to write {key} to cache {args.cache_file} because {err}')
+
+
+def get_package_from_cache(cache, navigator, notes):
 
     if cache != None and 'package' in cache:
         package_ = cache['package']
@@ -588,6 +1484,7 @@ def get_package_from_cache(cache, navigator):
         package_ = navigator.get_package_info()
         if cache is not None:
             cache['package'] = package_
+            commit_to_cache(cache, 'package', notes)
 
     return package_
 
@@ -618,8 +1515,9 @@ if __name__ == '__main__':
     parser.add_argument('-e', '--fail-early', dest='fail_early', default=False, action=STORE_TRUE,
                         help='exit on first error')
     parser.add_argument('-r', '--root', dest='root', default=None, help='root url to add command line arguments to')
-    parser.add_argument('-d', '--digest', dest='digest', default='sha256',
-                        help=f'which digest algorithm to use: \n\n{digests_formatted()}\n')
+    parser.add_argument('-d', '--digest', dest='digests', default=['sha256'], type=digest_list,
+                        help=f'which digest algorithms to use, a comma separated list calculates all of them '
+                             f'from a single download: \n\n{digests_formatted()}\n')
     parser.add_argument('-t', '--template', dest='use_templates', default=False, action=STORE_TRUE,
                         help='use urls as unix filename templates and scan the root page, --root must also be set...')
     parser.add_argument('-p', '--password', dest='password', nargs=2, default=(None, None),
@@ -631,6 +1529,23 @@ if __name__ == '__main__':
                         help=f'method to navigate to download url, currently (supported: {navigator_names})')
     parser.add_argument('-y', '--yes', default=False, dest='yes', action=STORE_TRUE,
                         help='answer yes to all questions, including accepting licenses')
+    parser.add_argument('--no-optimise', dest='optimise', default=True, action='store_false',
+                        help='resolve the download link of every file rather than extrapolating them from the link '
+                             'of the first file [xplor only]')
+    parser.add_argument('--per-page', dest='per_page', type=positive_int, default=100, metavar='N',
+                        help='number of releases to request per page of results [github_release only, default: 100]')
+    parser.add_argument('--trust-upstream', dest='trust_upstream', default=False, action=STORE_TRUE,
+                        help="use the digests published by the site a file comes from [e.g. pypi's json] rather than "
+                             "downloading the file [only supported by some navigators, eg pip]")
+    parser.add_argument('--verify-sample', dest='verify_sample', type=positive_int, default=None, metavar='N',
+                        help='with --trust-upstream download and hash a random sample of N files to check the '
+                             'published digests')
+    parser.add_argument('--verify-max-size', dest='verify_max_size', type=size_in_bytes, default=None,
+                        metavar='BYTES', help='with --trust-upstream download and hash the files no larger than BYTES '
+                                              'to check the published digests [combines with --verify-sample]')
+    parser.add_argument('--flush', dest='flush', choices=FLUSH_POLICIES, default=AUTO,
+                        help='when to flush the output: after each result, only at the end, or auto: after each result '
+                             'when a streaming output [eg jsonl] is piped to another program [default: auto]')
     parser.add_argument('-o', '--output', dest='output_format', default='simple',
                         help=f'define the output methods (supported: {output_names})')
     parser.add_argument('-m', '--main', dest='main_file_template', default=None,
@@ -640,7 +1555,29 @@ if __name__ == '__main__':
                              f'it should create a single match for each url, all others are discarded'
                              r'default: ([0-9]+\.(?:[0-9]+[A-Za-z0-9_-]*\.[0-9]+[A-Za-z0-9_-]*))+')
     parser.add_argument('-c', '--cache', dest='cache_file', type=str, metavar='CACHE-FILE', default=None,
-                        help='use a cached values from a  file if available to limit bandwidth used')
+                        help='use a cached values from a  file if available to limit bandwidth used, the file is a '
+                             'journal of json lines and each digest is saved as soon as it is calculated, an older '
+                             'yaml or json cache is read but new values are saved in a file with the suffix .jsonl')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=positive_int, default=1, metavar='N',
+                        help='number of urls to download and hash concurrently [default: 1]')
+    parser.add_argument('--buffer-size', dest='buffer_size', type=size_in_bytes, default=DEFAULT_BUFFER_SIZE,
+                        metavar='BYTES', help='size of the read buffer used when hashing local files, '
+                                              'accepts K, M and G suffixes [default: 1M]')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=chunk_size_or_auto, default=AUTO,
+                        metavar='BYTES', help='size of the reads used when hashing downloads, auto grows the reads '
+                                              'from 1M to 8M with the measured bandwidth [default: auto]')
+    parser.add_argument('-s', '--store', dest='store', metavar='DIRECTORY', default=None,
+                        help='keep downloaded files in DIRECTORY so interrupted downloads resume and later runs reuse '
+                             'them, files are also filed by sha256 so the directory can be used as a spack mirror')
+    parser.add_argument('--no-revalidate', dest='revalidate', default=True, action='store_false',
+                        help="trust cached digests without checking the file on the server hasn't changed "
+                             "[by default a conditional request using the cached ETag / Last-Modified is made]")
+    parser.add_argument('--retries', dest='retries', type=non_negative_int, default=DEFAULT_RETRIES, metavar='N',
+                        help=f'number of times to retry a request after a connection error or a transient server '
+                             f'error [default: {DEFAULT_RETRIES}]')
+    parser.add_argument('--backoff', dest='backoff', type=float, default=DEFAULT_BACKOFF, metavar='SECONDS',
+                        help=f'base delay for the exponential backoff between retries, the delays are randomised '
+                             f'to spread out retries [default: {DEFAULT_BACKOFF}]')
     parser.add_argument('--debug', dest='debug', default=False, action='store_true',
                         help=f'debug mode: use hashes of filenames rather than hashes of downloaded files for speed when debugging')
 
@@ -658,10 +1595,8 @@ if __name__ == '__main__':
 
     cache = get_cache(args.cache_file, notes)
 
-    if cache != None:
-        original_cache = copy.deepcopy(cache)
-
-    session = requests.session()
+    auth_schemes = cache.get(AUTH_SCHEMES) if cache != None else None
+    session = create_session(args.jobs + 1, args.retries, args.backoff, auth_schemes)
 
     navigators = get_navigator(name=args.navigator, target_browser=session, target_args=args)
 
@@ -669,103 +1604,55 @@ if __name__ == '__main__':
 
     navigator = navigators[0](session, args)
 
+    if cache != None and URL_TEMPLATES in cache:
+        navigator.set_url_templates(cache[URL_TEMPLATES])
+
+    if cache != None and NAVIGATOR_CACHE in cache:
+        navigator.set_navigator_cache_data(cache[NAVIGATOR_CACHE])
+
     if args.root != None:
         navigator.login_with_form(args.root, args.password, args.form, verbose=args.verbose)
 
     out = get_output(name=args.output_format, target_args=args)
-    out.digest = args.digest
+    out.digest = args.digests[0]
+    out.digests = args.digests
 
     if args.root != None:
-        urls = navigator.get_urls()
+        urls = navigator.iter_urls()
     else:
-        urls=args.urls
-
-    max_length_url = get_max_string_length(urls)
-    num_urls = len(urls)
-
-    package_info = get_package_from_cache(cache, navigator)
-
-    version_info = OrderedDict()
-    hashes = {}
-    for i, url in enumerate(urls):
-        x_of_y = '%3i/%-3i' % (i + 1, len(urls))
-
-        version = navigator.get_version(url)
-
-        hash_type = args.digest
-
-
-        if not navigator.have_cache():
-            if verbose >=2:
-                print(f"NOTE: cache requested but the navigator {navigator.name()} doesn't support caching", file=sys.stderr)
-            have_cache = False
-        elif cache != None and url in cache:
-            have_cache = url in cache and args.digest in cache[url][DIGESTS]
-        else:
-            have_cache = False
-
-        try:
-            _hash = None
-            if have_cache:
-                if hash_type in cache[url][DIGESTS] and navigator.have_cache():
-                    _hash = cache[url][DIGESTS][hash_type]
-                    hashes[url] = _hash
-                    navigator.set_cache_data(url, cache[url][CACHE_DATA])
-
-                    if verbose >=1:
-                        notes.append(f"NOTE: using cached data for {url} [version: {version}]")
-
-            if _hash is None:
-                if is_url(url):
-                    specific_url = navigator.login_and_get_url(url)
-                    _hash, hash_type = get_hash_from_url(specific_url, session, verbose, x_of_y, digest=args.digest,
-                                                         username_password=args.password, debug=args.debug)
-                else:
-                    file_name = os.path.expanduser(url)
-                    exit_if_file_doesnt_exist(file_name)
-                    _hash, hash_type = get_hash_from_file(file_name,digest=args.digest)
-
-                hashes[url] = _hash
-
-                if cache != None  and navigator.have_cache():
-                    if verbose>=1:
-                        notes.append(f"NOTE: creating cached data for {url} [version: {version}]")
-                    cache_digests = cache.setdefault(url, {}).setdefault(DIGESTS, {})
-                    cache[url][DIGESTS][hash_type] = _hash
-                    cache[url][CACHE_DATA] = navigator.get_cache_data(url)
+        urls = args.urls
 
-            if args.debug:
-                _hash = f'!DEBUG!-{_hash}-!FAKE!'
+    package_info = get_package_from_cache(cache, navigator, notes)
 
-        except DownloadFailedException as e:
+    store = DownloadStore(args.store) if args.store else None
 
-            report_error(url, e, max_length_url, i + 1)
-
-            if args.fail_early:
-                exit_if_asked()
+    pipeline = ChecksumPipeline(navigator, session, out, args, cache, store, notes)
+    pipeline.run(urls)
 
+    if cache != None:
+        if session.auth_schemes and cache.get(AUTH_SCHEMES) != session.auth_schemes:
+            cache[AUTH_SCHEMES] = dict(session.auth_schemes)
+            commit_to_cache(cache, AUTH_SCHEMES, notes)
+        if navigator.get_url_templates() and cache.get(URL_TEMPLATES) != navigator.get_url_templates():
+            cache[URL_TEMPLATES] = dict(navigator.get_url_templates())
+            commit_to_cache(cache, URL_TEMPLATES, notes)
+        navigator_cache_data = navigator.get_navigator_cache_data()
+        if navigator_cache_data and cache.get(NAVIGATOR_CACHE) != navigator_cache_data:
+            cache[NAVIGATOR_CACHE] = navigator_cache_data
+            commit_to_cache(cache, NAVIGATOR_CACHE, notes)
+        cache.close()
+
+    # printed last so notes about failing to write the cache are included
     for note in notes:
         print(note, file=sys.stderr)
         sys.stderr.flush()
 
-    if cache != None and original_cache != cache:
-        if verbose:
-            notes.append('NOTE: cache changed, updating...')
-        try:
-            with open(args.cache_file, 'w') as cache_file:
-                cache_file.write(json.dumps(cache, indent=4))
-        except IOError as err:
-            notes.append(f'NOTE: failed to write cache to {args.cache_file} because {err}')
-
     if len(notes):
         print(file=sys.stderr)
 
-    for i, url in enumerate(urls):
-        out.display_hash(url, hashes[url], max_length_url, i + 1, num_urls, hash_type=hash_type)
-        version_info[url] = navigator.get_extra_info(url)
-
-    print()
-    out.finish(package_info, version_info)
+    if not out.MACHINE_READABLE:
+        print()
+    out.finish(package_info, pipeline.version_info)
 
 
 
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import urlparse
+
+# an on disk store of downloaded files for checksum_url.py, files are kept under the url they came from together
+# with the ETag / Last-Modified headers they were served with and are also linked in by their sha256 using the
+# layout of a spack source mirror [_source-cache/archive/<2 characters>/<sha256>.<extension>] so the store can be
+# added with spack mirror add
+
+META_FILE = 'meta.json'
+DATA_FILE = 'data'
+PART_FILE = 'data.part'
+
+URLS = 'urls'
+DIGESTS = 'digests'
+SPACK_ARCHIVE = Path('_source-cache') / 'archive'
+
+URL = 'url'
+ETAG = 'etag'
+LAST_MODIFIED = 'last_modified'
+CONTENT_LENGTH = 'content_length'
+COMPLETE = 'complete'
+
+ARCHIVE_EXTENSIONS = ['.tar.gz', '.tar.bz2', '.tar.xz', '.tar.Z']
+
+
+def url_to_extension(url):
+    name = Path(urlparse(url).path).name
+
+    result = ''
+    for extension in ARCHIVE_EXTENSIONS:
+        if name.endswith(extension):
+            result = extension
+            break
+
+    if not result:
+        result = Path(name).suffix
+
+    return result
+
+
+def response_validators(response):
+    """the headers of a response that identify the version of a file on the server"""
+    result = {}
+
+    etag = response.headers.get('etag')
+    if etag:
+        result[ETAG] = etag
+
+    last_modified = response.headers.get('last-modified')
+    if last_modified:
+        result[LAST_MODIFIED] = last_modified
+
+    return result
+
+
+def conditional_headers(validators):
+    """request headers that ask the server to reply 304 Not Modified if the file hasn't changed"""
+    result = {}
+    if validators:
+        if ETAG in validators:
+            result['If-None-Match'] = validators[ETAG]
+        if LAST_MODIFIED in validators:
+            result['If-Modified-Since'] = validators[LAST_MODIFIED]
+    return result
+
+
+def content_range_start(response):
+    """the offset of the first byte of a 206 Partial Content response or None if it doesn't have a Content-Range"""
+    match = re.match(r'bytes\s+(\d+)-', response.headers.get('content-range', ''))
+    return int(match.group(1)) if match else None
+
+
+def _write_json_atomically(path, data):
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'w') as file_handle:
+        json.dump(data, file_handle, indent=4)
+    os.replace(temp_path, path)
+
+
+def _link_or_copy(source, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class DigestingWriter:
+    """write each chunk to a file as it is digested so the download and the hash come from the same bytes"""
+
+    def __init__(self, file_handle, digester):
+        self._file_handle = file_handle
+        self._digester = digester
+
+    def update(self, data):
+        self._file_handle.write(data)
+        self._digester.update(data)
+
+
+class StoreEntry:
+
+    def __init__(self, store, url):
+        self._store = store
+        self.url = url
+        self.path = store.url_path(url)
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        result = {URL: self.url}
+        meta_path = self.path / META_FILE
+        if meta_path.is_file():
+            try:
+                with open(meta_path) as file_handle:
+                    result = json.load(file_handle)
+            except (IOError, ValueError):
+                pass
+        return result
+
+    def _write_meta(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        _write_json_atomically(self.path / META_FILE, self.meta)
+
+    @property
+    def data_path(self):
+        return self.path / DATA_FILE
+
+    @property
+    def part_path(self):
+        return self.path / PART_FILE
+
+    @property
+    def validators(self):
+        return {key: self.meta[key] for key in (ETAG, LAST_MODIFIED) if key in self.meta}
+
+    def is_complete(self):
+        return self.meta.get(COMPLETE, False) and self.data_path.is_file()
+
+    def part_size(self):
+        return self.part_path.stat().st_size if self.part_path.is_file() else 0
+
+    def request_headers(self):
+        """headers to either revalidate a complete file or resume a partial one with an HTTP range request"""
+        result = {}
+        validators = self.validators
+        if self.is_complete():
+            result = conditional_headers(validators)
+        elif validators and self.part_size() > 0:
+            result['Range'] = f'bytes={self.part_size()}-'
+            result['If-Range'] = validators[ETAG] if ETAG in validators else validators[LAST_MODIFIED]
+        return result
+
+    def is_current(self, response):
+        """true if response shows the stored file is still current: the server answered 304 Not Modified to the
+        revalidation or, for a server that sends no ETag or Last-Modified, the file still has the stored length"""
+        result = False
+        if self.is_complete():
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                result = True
+            elif response.status_code == HTTPStatus.OK and not self.validators and not response_validators(response):
+                content_length = response.headers.get('content-length')
+                result = content_length is not None and int(content_length) == self.meta.get(CONTENT_LENGTH)
+        return result
+
+    def resumes_part(self, response):
+        """true if response is the rest of the part file, a range starting anywhere else can't be appended to it"""
+        return response.status_code == HTTPStatus.PARTIAL_CONTENT and self.part_path.is_file() \
+            and content_range_start(response) == self.part_size()
+
+    def digests(self, digests):
+        """the stored digests for a complete file if all the requested ones are known, else None"""
+        stored = self.meta.get(DIGESTS, {})
+        result = None
+        if self.is_complete() and all(digest in stored for digest in digests):
+            result = {digest: stored[digest] for digest in digests}
+        return result
+
+    def open_writer(self, response, digester, hash_existing):
+        """open the part file for the body of response, if the server is resuming a previous download
+        [206 Partial Content] hash_existing(path, digester) is called to digest the bytes already on disk"""
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        resumed = self.resumes_part(response)
+        if resumed:
+            hash_existing(self.part_path, digester)
+            file_handle = open(self.part_path, 'ab')
+        else:
+            file_handle = open(self.part_path, 'wb')
+
+        self.meta = {URL: self.url, **response_validators(response)}
+        if not resumed and response.headers.get('content-length'):
+            self.meta[CONTENT_LENGTH] = int(response.headers['content-length'])
+        self._write_meta()
+
+        return file_handle, DigestingWriter(file_handle, digester)
+
+    def discard_part(self):
+        if self.part_path.is_file():
+            self.part_path.unlink()
+
+    def commit(self, hexdigests):
+        os.replace(self.part_path, self.data_path)
+
+        self.meta[CONTENT_LENGTH] = self.data_path.stat().st_size
+        self.meta[COMPLETE] = True
+        self.record_digests(hexdigests)
+
+    def record_digests(self, hexdigests):
+        self.meta.setdefault(DIGESTS, {}).update(hexdigests)
+        self._write_meta()
+
+        extension = url_to_extension(self.url)
+        for algorithm, hexdigest in hexdigests.items():
+            _link_or_copy(self.data_path, self._store.digest_path(algorithm, hexdigest, extension))
+
+
+class DownloadStore:
+
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def url_path(self, url):
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return self.root / URLS / key[:2] / key
+
+    def digest_path(self, algorithm, hexdigest, extension=''):
+        if algorithm == 'sha256':
+            result = self.root / SPACK_ARCHIVE / hexdigest[:2] / f'{hexdigest}{extension}'
+        else:
+            result = self.root / DIGESTS / algorithm / hexdigest[:2] / f'{hexdigest}{extension}'
+        return result
+
+    def entry(self, url):
+        return StoreEntry(self, url)
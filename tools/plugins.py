@@ -1,6 +1,8 @@
+import ast
 import importlib
-import inspect
+import json
 import os
+from collections import namedtuple
 from pathlib import Path
 
 import pluggy
@@ -10,44 +12,161 @@ CHECK_SUM_PROJECT = "check_sum_url"
 CHECK_SUM_SPEC = pluggy.HookspecMarker(CHECK_SUM_PROJECT)
 CHECK_SUM_IMPL = pluggy.HookimplMarker(CHECK_SUM_PROJECT)
 
+NAVIGATOR = 'navigator'
+OUTPUT = 'output'
+REGISTER_DECORATORS = {'register_navigator': NAVIGATOR, 'register_output': OUTPUT}
+
+# a plugin found by reading the source of the plugins directory without importing it
+PluginInfo = namedtuple('PluginInfo', 'name class_name kind module_name path'.split())
+
+# plugin classes that have been imported and registered themselves, keyed by (kind, name)
+loaded_plugins = {}
+
+# (kind, name) of the plugins registered from the manifest, their modules are only imported when they are used
+lazy_factories = set()
+
+# a snapshot of the plugin manifest is kept here so the plugin files don't have to be parsed on every run, it is
+# only used while the plugins directory and every plugin file have the modification times recorded in it
+PLUGIN_CACHE_DIRECTORY = 'nmrpack'
+PLUGIN_CACHE_FILE = 'checksum_plugins.json'
+PLUGINS_DIRECTORY = 'plugins_directory'
+DIRECTORY_MTIME = 'directory_mtime'
+FILE_MTIMES = 'file_mtimes'
+PLUGINS = 'plugins'
+
 
 def get_script_directory():
     return os.path.dirname(os.path.realpath(__file__))
 
 
-def load_plugins():
+def get_plugins_directory():
+    return Path(get_script_directory()) / Path('checksum_plugins')
 
-    result = []
 
-    plugins_dir = Path(get_script_directory()) / Path('checksum_plugins')
+def list_plugin_files(plugins_directory=None):
+    plugins_directory = get_plugins_directory() if plugins_directory is None else plugins_directory
+    return sorted(file_name for file_name in plugins_directory.iterdir()
+                  if file_name.suffix == '.py' and file_name.name.endswith('_plugin.py'))
 
-    importlib.import_module('checksum_plugins')
-    for file_name in plugins_dir.iterdir():
 
-        if file_name.suffix == '.py' and file_name.name.endswith('_plugin.py'):
-            module_name = 'checksum_plugins.' + file_name.name[0:-len('.py')]
-            result.append(importlib.import_module(module_name))
+def file_name_to_module_name(file_name):
+    return 'checksum_plugins.' + file_name.name[0:-len('.py')]
 
+
+def _decorator_kind(decorator):
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    name = decorator.id if isinstance(decorator, ast.Name) else getattr(decorator, 'attr', None)
+    return REGISTER_DECORATORS.get(name)
+
+
+def _class_plugin_name(class_def):
+    result = None
+    for statement in class_def.body:
+        if isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant):
+            if any(isinstance(target, ast.Name) and target.id == 'NAME' for target in statement.targets):
+                result = statement.value.value
     return result
 
 
-def find_factory_classes(modules):
+def scan_plugin_file(file_name):
+    """find the plugin classes in a plugin file by parsing it, a registered class whose NAME can't be read
+    without running the module is reported with the name None"""
+
+    tree = ast.parse(file_name.read_text(), filename=str(file_name))
 
     result = []
-    for module in modules:
-        for name, cls in inspect.getmembers(module, inspect.isclass):
-            if name.endswith('Factory'):
-                result.append(cls)
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            for decorator in node.decorator_list:
+                kind = _decorator_kind(decorator)
+                if kind:
+                    result.append(PluginInfo(_class_plugin_name(node), node.name, kind,
+                                             file_name_to_module_name(file_name), str(file_name)))
+    return result
+
+
+def scan_plugins(plugins_directory=None):
+    """build a manifest of all the plugins without importing any of them"""
+
+    result = []
+    for file_name in list_plugin_files(plugins_directory):
+        result.extend(scan_plugin_file(file_name))
+    return result
+
+
+def get_plugin_cache_file():
+    cache_directory = os.environ.get('XDG_CACHE_HOME') or Path('~/.cache').expanduser()
+    return Path(cache_directory) / PLUGIN_CACHE_DIRECTORY / PLUGIN_CACHE_FILE
+
+
+def _mtime(path):
+    return path.stat().st_mtime_ns
+
+
+def read_plugin_snapshot(cache_file, plugins_directory):
+    """the plugin manifest saved in cache_file or None if it is missing or any plugin file has changed since"""
+
+    result = None
+    try:
+        with open(cache_file) as file_handle:
+            snapshot = json.load(file_handle)
+
+        is_current = snapshot[PLUGINS_DIRECTORY] == str(plugins_directory) \
+            and snapshot[DIRECTORY_MTIME] == _mtime(plugins_directory) \
+            and all(_mtime(Path(file_name)) == mtime for file_name, mtime in snapshot[FILE_MTIMES].items())
+
+        if is_current:
+            result = [PluginInfo(*plugin) for plugin in snapshot[PLUGINS]]
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+
+    return result
+
+
+def write_plugin_snapshot(cache_file, plugins_directory, plugins):
+    snapshot = {
+        PLUGINS_DIRECTORY: str(plugins_directory),
+        DIRECTORY_MTIME: _mtime(plugins_directory),
+        FILE_MTIMES: {str(file_name): _mtime(file_name) for file_name in list_plugin_files(plugins_directory)},
+        PLUGINS: [list(plugin) for plugin in plugins]
+    }
+
+    # the cache is only an optimisation so failing to write it isn't an error
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_name(f'{cache_file.name}.{os.getpid()}.tmp')
+        with open(temp_file, 'w') as file_handle:
+            json.dump(snapshot, file_handle, indent=4)
+        os.replace(temp_file, cache_file)
+    except (IOError, OSError):
+        pass
+
+
+def discover_plugins(cache_file=None, plugins_directory=None):
+    """the plugin manifest, read from the snapshot in the cache if it is current, else by scanning the plugin files"""
+
+    cache_file = get_plugin_cache_file() if cache_file is None else Path(cache_file)
+    plugins_directory = get_plugins_directory() if plugins_directory is None else Path(plugins_directory)
+
+    result = read_plugin_snapshot(cache_file, plugins_directory)
+    if result is None:
+        result = scan_plugins(plugins_directory)
+        write_plugin_snapshot(cache_file, plugins_directory, result)
+
     return result
 
 
 def load_and_register_factory_classes():
-    modules = load_plugins()
-    factories = find_factory_classes(modules)
+    """register a factory for every plugin, a plugin's module is only imported when the plugin is used"""
+
+    importlib.import_module('checksum_plugins')
 
-    for factory in factories:
-        instance = factory()
-        pm.register(instance)
+    for plugin_info in discover_plugins():
+        if plugin_info.name is None:
+            importlib.import_module(plugin_info.module_name)
+        else:
+            register_lazy_factory(plugin_info)
 
 
 class BaseChecksumHookspecs:
@@ -82,65 +201,87 @@ def get_plugin_name(self, plugin_class):
 
 
 def create_navigator(self, name):
-    if name.lower() == self.NAME and self.CLASS == 'navigator':
-        return self.obj
+    if name.lower() == self.NAME and self.CLASS == NAVIGATOR:
+        return self.get_obj()
 
 
 def create_output(self, name):
-    if name.lower() == self.NAME and self.CLASS == 'output':
-        return self.obj
+    if name.lower() == self.NAME and self.CLASS == OUTPUT:
+        return self.get_obj()
+
+
+def get_obj(self):
+    return self.obj
+
+
+def get_lazy_obj(self):
+    key = self.CLASS, self.NAME
+    if key not in loaded_plugins:
+        importlib.import_module(self.MODULE)
+    if key not in loaded_plugins:
+        raise Exception(f"Error: importing {self.MODULE} didn't register the {self.CLASS} {self.NAME}")
+    return loaded_plugins[key]
+
+
+CREATE_METHODS = {NAVIGATOR: ('create_navigator', create_navigator), OUTPUT: ('create_output', create_output)}
+
+
+def create_factory_class(factory_name, name, kind, attributes):
+    create_method_name, create_method = CREATE_METHODS[kind]
+    return type(factory_name,
+                (),
+                {'NAME': name,
+                 'CLASS': kind,
+                 'get_plugin_name': CHECK_SUM_IMPL(get_plugin_name),
+                 create_method_name: CHECK_SUM_IMPL(create_method),
+                 **attributes
+                 })
+
+
+def register_lazy_factory(plugin_info):
+    key = plugin_info.kind, plugin_info.name
+    if key not in lazy_factories and key not in loaded_plugins:
+        factory = create_factory_class(f'{plugin_info.class_name}Factory', plugin_info.name, plugin_info.kind,
+                                       {'MODULE': plugin_info.module_name, 'get_obj': get_lazy_obj})
+        pm.register(factory())
+        lazy_factories.add(key)
+
+
+def register_plugin(obj, kind):
+    if not hasattr(obj, 'NAME'):
+        raise Exception('Error: a plugin requires a class variable NAME')
+
+    key = kind, obj.NAME
+    loaded_plugins[key] = obj
+
+    # plugins from the manifest already have a factory which will now find this class
+    if key not in lazy_factories:
+        factory = create_factory_class(f'{obj.__name__}Factory', obj.NAME, kind, {'obj': obj, 'get_obj': get_obj})
+        pm.register(factory())
+
+    return obj
 
 
 def register_navigator():
     def f(obj):
-        if not hasattr(obj, 'NAME'):
-            raise Exception('Error: a plugin requires a class variable NAME')
-        factory_name = f'{obj.__name__}Factory'
-        factory = type(factory_name,
-                       (),
-                       {'NAME': obj.NAME,
-                        'CLASS': 'navigator',
-                        'get_plugin_name': CHECK_SUM_IMPL(get_plugin_name),
-                        'create_navigator': CHECK_SUM_IMPL(create_navigator),
-                        'obj': obj
-                        })
-
-        factory_object = factory()
-        pm.register(factory_object)
-
-        return obj
+        return register_plugin(obj, NAVIGATOR)
 
     return f
 
 
 def register_output():
     def f(obj):
-        if not hasattr(obj, 'NAME'):
-            raise Exception('Error: a plugin requires a class variable NAME')
-        factory_name = f'{obj.__name__}Factory'
-        factory = type(factory_name,
-                       (),
-                       {'NAME': obj.NAME,
-                        'CLASS': 'output',
-                        'get_plugin_name': CHECK_SUM_IMPL(get_plugin_name),
-                        'create_output': CHECK_SUM_IMPL(create_output),
-                        'obj': obj
-                        })
-
-        factory_object = factory()
-        pm.register(factory_object)
-
-        return obj
+        return register_plugin(obj, OUTPUT)
 
     return f
 
 
 def list_navigators():
-    return ', '.join(pm.hook.get_plugin_name(plugin_class = 'navigator'))
+    return ', '.join(pm.hook.get_plugin_name(plugin_class = NAVIGATOR))
 
 
 def list_outputs():
-    return ', '.join(pm.hook.get_plugin_name(plugin_class  ='output'))
+    return ', '.join(pm.hook.get_plugin_name(plugin_class  =OUTPUT))
 
 
 def get_navigator(name=None, target_browser=None, target_args=None):
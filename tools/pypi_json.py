@@ -1,32 +1,173 @@
 import argparse
+import hashlib
 import json
+import os
 import sys
-import tarfile
-import tempfile
-import zipfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from pathlib import Path
 
 import requests
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
 
+# fetch the json metadata of pypi packages, many packages are fetched concurrently and each response is kept in an
+# on disk cache [or a dict the caller saves], a cached response is used without a request until it is older than the
+# time to live [ttl] and is then revalidated with its ETag so an unchanged package costs a 304 rather than the whole
+# document
 
-def download(target_url):
+PYPI_URL = 'https://pypi.org/pypi'
 
-    response = requests.get(target_url)
-    if response.status_code != 200:
-        raise Exception(f'failed to down load {target_url} ')
+DEFAULT_TTL = 60 * 60
+DEFAULT_JOBS = 8
 
-    return response.content
+URL = 'url'
+ETAG = 'etag'
+FETCHED = 'fetched'
+DATA = 'data'
+
+
+def get_default_cache_directory():
+    cache_directory = os.environ.get('XDG_CACHE_HOME') or Path('~/.cache').expanduser()
+    return Path(cache_directory) / 'nmrpack' / 'pypi_json'
+
+
+def split_requirement(requirement):
+    """split name==version into its name and version, the version is None if it isn't given"""
+    name, _, version = requirement.partition('==')
+    return name.strip(), version.strip() or None
+
+
+def positive_int(value):
+    result = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f'expected an integer >= 1, got {value}')
+    return result
+
+
+def _is_cache_entry(entry):
+    return isinstance(entry, dict) and DATA in entry and isinstance(entry.get(FETCHED), (int, float))
+
+
+def _write_json_atomically(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(temp_path, 'w') as file_handle:
+        json.dump(data, file_handle)
+    os.replace(temp_path, path)
+
+
+class PypiMetadata:
+
+    def __init__(self, session=None, cache_directory=None, ttl=DEFAULT_TTL, jobs=DEFAULT_JOBS, pypi_url=PYPI_URL,
+                 entries=None):
+        """responses are cached in cache_directory or if entries is given in that dict keyed by url, with neither
+        nothing is cached"""
+
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_maxsize=jobs))
+            session.mount('http://', HTTPAdapter(pool_maxsize=jobs))
+        self._session = session
+        self._cache_directory = Path(cache_directory).expanduser() if cache_directory else None
+        self._entries = entries
+        self._ttl = ttl
+        self._jobs = jobs
+        self._pypi_url = pypi_url.rstrip('/')
+
+    def json_url(self, name, version=None):
+        """the url of the json for all the releases of a package or only the given version"""
+        if version:
+            result = f'{self._pypi_url}/{name}/{version}/json'
+        else:
+            result = f'{self._pypi_url}/{name}/json'
+        return result
+
+    def _cache_path(self, url):
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return self._cache_directory / key[:2] / f'{key}.json'
+
+    def _read_cache(self, url):
+        result = None
+        if self._entries is not None:
+            result = self._entries.get(url)
+        elif self._cache_directory:
+            try:
+                with open(self._cache_path(url)) as file_handle:
+                    result = json.load(file_handle)
+            except (IOError, ValueError):
+                pass
+
+        # a damaged entry is treated as missing
+        return result if _is_cache_entry(result) else None
+
+    def _write_cache(self, url, entry):
+        if self._entries is not None:
+            self._entries[url] = entry
+        elif self._cache_directory:
+            try:
+                _write_json_atomically(self._cache_path(url), entry)
+            except (IOError, OSError) as err:
+                print(f'WARNING: failed to cache {url} because {err}', file=sys.stderr)
+
+    def get_url(self, url):
+        """the json at url from the cache if it is fresh, else from the server [revalidating the cached copy if
+        there is one], None if the server doesn't have it"""
+
+        cached = self._read_cache(url)
+        if cached and time.time() - cached[FETCHED] < self._ttl:
+            return cached[DATA]
+
+        headers = {'If-None-Match': cached[ETAG]} if cached and cached.get(ETAG) else None
+        response = self._session.get(url, headers=headers, timeout=30)
+
+        if response.status_code == HTTPStatus.NOT_MODIFIED and cached:
+            entry = cached
+        elif response.status_code == HTTPStatus.OK:
+            entry = {URL: url, ETAG: response.headers.get('etag'), DATA: response.json()}
+        elif response.status_code == HTTPStatus.NOT_FOUND:
+            entry = None
+        else:
+            raise Exception(f'failed to download {url} [{response.status_code}]')
+
+        if entry is not None:
+            entry[FETCHED] = time.time()
+            self._write_cache(url, entry)
+
+        return entry[DATA] if entry else None
+
+    def get(self, name, version=None):
+        return self.get_url(self.json_url(name, version))
+
+    def get_many(self, requirements):
+        """the json for each of a list of names or name==version requirements fetched concurrently, keyed by
+        requirement in the order given"""
+
+        urls = [self.json_url(*split_requirement(requirement)) for requirement in requirements]
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            results = executor.map(self.get_url, urls)
+
+        return OrderedDict(zip(requirements, results))
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='calculate hashes from web links.')
-    parser.add_argument('names', nargs='*')
+    parser = argparse.ArgumentParser(description='download the pypi json metadata for packages.')
+    parser.add_argument('names', nargs='*', help='package names, use name==version for just one version')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=positive_int, default=DEFAULT_JOBS,
+                        help=f'number of packages to fetch concurrently [default: {DEFAULT_JOBS}]')
+    parser.add_argument('--ttl', dest='ttl', type=float, default=DEFAULT_TTL,
+                        help=f'seconds a cached response is used before it is revalidated [default: {DEFAULT_TTL}]')
+    parser.add_argument('-c', '--cache-dir', dest='cache_directory', default=str(get_default_cache_directory()),
+                        help='directory to cache responses in [default: %(default)s]')
+    parser.add_argument('--no-cache', dest='cache_directory', action='store_const', const=None,
+                        help="don't cache responses")
 
     args = parser.parse_args()
 
-    for name in args.names:
-        json_text = download(f'https://pypi.org/pypi/{name}/json')
-        print(json_text)
-        print(json.dumps(json.loads(json_text), indent=4, sort_keys=True))
-
+    metadata = PypiMetadata(cache_directory=args.cache_directory, ttl=args.ttl, jobs=args.jobs)
+    for name, json_data in metadata.get_many(args.names).items():
+        if json_data is None:
+            print(f'WARNING: {name} not found on pypi', file=sys.stderr)
+        else:
+            print(json.dumps(json_data, indent=4, sort_keys=True))
@@ -0,0 +1,60 @@
+import json
+
+from tools.checksum_cache import JournalCache, KEY, VALUE
+
+
+def test_commit_appends_and_reloads(tmp_path):
+    cache_file = tmp_path / 'cache.jsonl'
+
+    cache = JournalCache(cache_file)
+    cache['https://example.com/a.tar.gz'] = {'digests': {'sha256': 'ab12'}}
+    cache.commit('https://example.com/a.tar.gz')
+    cache['https://example.com/a.tar.gz']['digests']['md5'] = 'cd34'
+    cache.commit('https://example.com/a.tar.gz')
+    cache.close()
+
+    assert len(cache_file.read_text().splitlines()) == 2
+
+    reloaded = JournalCache(cache_file)
+    assert reloaded == {'https://example.com/a.tar.gz': {'digests': {'sha256': 'ab12', 'md5': 'cd34'}}}
+
+
+def test_interrupted_write_is_ignored(tmp_path):
+    cache_file = tmp_path / 'cache.jsonl'
+    record = json.dumps({KEY: 'package', VALUE: {'name': 'NMRPipe'}})
+    cache_file.write_text(record + '\n' + '{"key": "https://example.com/a.tar.gz", "val')
+
+    cache = JournalCache(cache_file)
+
+    assert cache == {'package': {'name': 'NMRPipe'}}
+    assert cache_file.read_text() == record + '\n'
+
+
+def test_legacy_cache_is_read_but_not_changed(tmp_path):
+    cache_file = tmp_path / 'cache.yml'
+    legacy_text = json.dumps({'package': {'name': 'NMRPipe'}}, indent=4)
+    cache_file.write_text(legacy_text)
+
+    cache = JournalCache(cache_file)
+    cache['https://example.com/a.tar.gz'] = {'digests': {'sha256': 'ab12'}}
+    cache.commit('https://example.com/a.tar.gz')
+    cache.close()
+
+    assert cache.journal_path == tmp_path / 'cache.jsonl'
+    assert cache_file.read_text() == legacy_text
+    assert JournalCache(cache_file) == {'package': {'name': 'NMRPipe'},
+                                        'https://example.com/a.tar.gz': {'digests': {'sha256': 'ab12'}}}
+
+
+def test_unreadable_legacy_cache_is_left_alone(tmp_path, capsys):
+    cache_file = tmp_path / 'cache.yml'
+    cache_file.write_text('package: [unclosed')
+
+    cache = JournalCache(cache_file)
+    cache['package'] = {'name': 'NMRPipe'}
+    cache.commit('package')
+    cache.close()
+
+    assert "can't be read" in capsys.readouterr().err
+    assert cache_file.read_text() == 'package: [unclosed'
+    assert json.loads((tmp_path / 'cache.jsonl').read_text()) == {KEY: 'package', VALUE: {'name': 'NMRPipe'}}
@@ -0,0 +1,260 @@
+import argparse
+import importlib
+import time
+from argparse import Namespace
+from pathlib import Path
+from threading import Barrier, Event, Lock, Thread
+
+import pytest
+
+TOOLS_DIRECTORY = str(Path(__file__).parent.parent)
+
+SITE = 'https://example.org/download'
+
+
+@pytest.fixture
+def checksum_url(monkeypatch):
+    monkeypatch.syspath_prepend(TOOLS_DIRECTORY)
+    return importlib.import_module('checksum_url')
+
+
+def test_non_negative_int(checksum_url):
+    assert checksum_url.non_negative_int('0') == 0
+    assert checksum_url.non_negative_int('3') == 3
+    with pytest.raises(argparse.ArgumentTypeError):
+        checksum_url.non_negative_int('-1')
+
+
+def test_url_template_from_link(checksum_url):
+    template = checksum_url.url_template_from_link('xplor-nih-3.8.tar.gz', f'{SITE}/3.8/xplor-nih-3.8.tar.gz?id=1')
+    assert template == f'{SITE}/3.8/{{name}}?id=1'
+
+    # names with spaces are quoted as they are in the url
+    template = checksum_url.url_template_from_link('Linux 64 bit', f'{SITE}/Linux%2064%20bit/file')
+    assert template == f'{SITE}/{{name}}/file'
+
+    # if the name isn't in the url the last part of the path is replaced
+    assert checksum_url.url_template_from_link('Mac', f'{SITE}/files/12345') == f'{SITE}/files/{{name}}'
+
+
+def test_url_from_template(checksum_url):
+    assert checksum_url.url_from_template(f'{SITE}/{{name}}?id=1', 'Linux 64 bit') == f'{SITE}/Linux%2064%20bit?id=1'
+
+
+class FakeSite:
+    """resolve_link and _link_exists for a site whose download urls are SITE/<name> except for the names in moved"""
+
+    def __init__(self, moved=(), head_works=True, parallel=0):
+        self.moved = set(moved)
+        self.head_works = head_works
+        self.resolved = []
+        self._lock = Lock()
+
+        # links that are walked in parallel wait for each other here, walking them one at a time breaks the barrier
+        self._barrier = Barrier(parallel, timeout=5) if parallel else None
+
+    def url(self, name):
+        return f'{SITE}/moved/{name}' if name in self.moved else f'{SITE}/{name}'
+
+    def resolve_link(self, name):
+        with self._lock:
+            self.resolved.append(name)
+            is_first = len(self.resolved) == 1
+        if self._barrier and not is_first:
+            self._barrier.wait()
+        return self.url(name)
+
+    def link_exists(self, url):
+        return self.head_works and url in {self.url(name) for name in NAMES}
+
+
+NAMES = ['a.tar.gz', 'b.tar.gz', 'c.tar.gz', 'd.tar.gz']
+
+
+def _navigator(checksum_url, site, optimise=True, jobs=4):
+    class TestNavigator(checksum_url.Navigator):
+        def get_extra_info(self, url):
+            return {}
+
+        def get_package_info(self):
+            return {}
+
+    navigator = TestNavigator(None, Namespace(optimise=optimise, jobs=jobs))
+    navigator._target_url = SITE
+    navigator._link_exists = site.link_exists
+    return navigator
+
+
+def test_resolve_links_guesses_from_a_template(checksum_url):
+    site = FakeSite()
+    navigator = _navigator(checksum_url, site)
+
+    assert navigator._resolve_links(NAMES, site.resolve_link) == [site.url(name) for name in NAMES]
+    assert site.resolved == ['a.tar.gz']
+    assert navigator.get_url_templates() == {SITE: f'{SITE}/{{name}}'}
+
+
+def test_resolve_links_walks_links_in_parallel_if_head_fails(checksum_url):
+    site = FakeSite(head_works=False, parallel=len(NAMES) - 1)
+    navigator = _navigator(checksum_url, site)
+
+    assert navigator._resolve_links(NAMES, site.resolve_link) == [site.url(name) for name in NAMES]
+    assert sorted(site.resolved) == NAMES
+
+
+def test_resolve_links_relearns_a_stale_template(checksum_url):
+    site = FakeSite(moved=NAMES)
+    navigator = _navigator(checksum_url, site)
+    navigator.set_url_templates({SITE: f'{SITE}/old/{{name}}'})
+
+    assert navigator._resolve_links(NAMES, site.resolve_link) == [site.url(name) for name in NAMES]
+    assert site.resolved == ['a.tar.gz']
+    assert navigator.get_url_templates() == {SITE: f'{SITE}/moved/{{name}}'}
+
+
+def test_resolve_links_walks_every_link_without_optimise(checksum_url):
+    site = FakeSite(parallel=len(NAMES) - 1)
+    navigator = _navigator(checksum_url, site, optimise=False)
+
+    assert navigator._resolve_links(NAMES, site.resolve_link) == [site.url(name) for name in NAMES]
+    assert sorted(site.resolved) == NAMES
+
+
+def test_ordered_results_emit_in_order(checksum_url):
+    emitted = []
+    results = checksum_url.OrderedResults(lambda index, result: emitted.append((index, result)))
+
+    results.add(2, 'c')
+    results.add(0, 'a')
+    assert emitted == [(0, 'a')]
+    assert len(results) == 1
+
+    results.add(1, 'b')
+    assert emitted == [(0, 'a'), (1, 'b'), (2, 'c')]
+    assert len(results) == 0
+
+
+def test_ordered_results_flush_after_a_gap(checksum_url):
+    emitted = []
+    results = checksum_url.OrderedResults(lambda index, result: emitted.append(index))
+
+    for index in (0, 2, 3):
+        results.add(index, None)
+    assert emitted == [0]
+
+    results.flush()
+    assert emitted == [0, 2, 3]
+
+    results.add(4, None)
+    assert emitted == [0, 2, 3, 4]
+
+
+def test_select_urls_to_verify(checksum_url):
+    url_sizes = {'a': 10, 'b': 1000, 'c': None, 'd': 20}
+
+    assert checksum_url.select_urls_to_verify(url_sizes) == set()
+
+    # urls of unknown size are never verified with a size limit
+    assert checksum_url.select_urls_to_verify(url_sizes, max_size=100) == {'a', 'd'}
+
+    sample = checksum_url.select_urls_to_verify(url_sizes, sample_size=2)
+    assert len(sample) == 2 and sample <= set(url_sizes)
+
+    assert checksum_url.select_urls_to_verify(url_sizes, sample_size=1, max_size=15) == {'a'}
+    assert checksum_url.select_urls_to_verify(url_sizes, sample_size=10) == set(url_sizes)
+    assert checksum_url.select_urls_to_verify(url_sizes, sample_size=0) == set()
+
+
+class FakeNavigator:
+
+    def __init__(self):
+        self.seen = []
+
+    def get_version(self, url):
+        self.seen.append(url)
+        return '1.0'
+
+    def have_cache(self):
+        return False
+
+    def get_extra_info(self, url):
+        return {}
+
+
+class FakeOutput:
+
+    def __init__(self):
+        self.records = []
+
+    def on_result(self, url, digests, url_field_length, index, num_urls=None, extra_info=None):
+        self.records.append((index, url, digests['sha256']))
+
+    def on_error(self, url, error, url_field_length, index):
+        self.records.append((index, url, error.reason))
+
+
+def _pipeline(checksum_url, jobs, fail_early=False):
+    args = Namespace(jobs=jobs, trust_upstream=False, verify_sample=None, digests=['sha256'], verbose=0,
+                     revalidate=True, fail_early=fail_early)
+    navigator = FakeNavigator()
+    out = FakeOutput()
+    return checksum_url.ChecksumPipeline(navigator, None, out, args, None, None, []), navigator, out
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_pipeline_holds_back_the_navigator(checksum_url, monkeypatch):
+    jobs = 2
+    bound = checksum_url.PENDING_PER_JOB * jobs
+    urls = [f'https://example.org/{index}.tar.gz' for index in range(bound * 3)]
+
+    release = Event()
+
+    def calculate_hash(url, *args):
+        release.wait(timeout=5)
+        return checksum_url.HashResult({'sha256': url}, {})
+
+    monkeypatch.setattr(checksum_url, 'calculate_hash', calculate_hash)
+    pipeline, navigator, out = _pipeline(checksum_url, jobs)
+
+    runner = Thread(target=pipeline.run, args=(iter(urls),), daemon=True)
+    runner.start()
+
+    # while nothing finishes only bound urls are taken from the navigator
+    assert _wait_for(lambda: len(navigator.seen) == bound)
+    time.sleep(0.2)
+    assert len(navigator.seen) == bound
+    assert out.records == []
+
+    release.set()
+    runner.join(timeout=5)
+    assert not runner.is_alive()
+    assert out.records == [(index + 1, url, url) for index, url in enumerate(urls)]
+
+
+def test_pipeline_fail_early_writes_finished_urls_in_order(checksum_url, monkeypatch):
+    urls = ['https://example.org/a.tar.gz', 'https://example.org/b.tar.gz', 'https://example.org/c.tar.gz']
+    b_finished = Event()
+
+    def calculate_hash(url, navigator, session, args, count, positions, stop_event, *rest):
+        if url == urls[0]:
+            assert b_finished.wait(timeout=5)
+            raise checksum_url.DownloadFailedException('download failed [response was 404]', 'response was 404')
+        if url == urls[2]:
+            stop_event.wait(timeout=5)
+            raise checksum_url.DownloadCancelledException()
+        b_finished.set()
+        return checksum_url.HashResult({'sha256': url}, {})
+
+    monkeypatch.setattr(checksum_url, 'calculate_hash', calculate_hash)
+    pipeline, navigator, out = _pipeline(checksum_url, jobs=3, fail_early=True)
+
+    with pytest.raises(SystemExit):
+        pipeline.run(urls)
+
+    assert out.records == [(1, urls[0], 'response was 404'), (2, urls[1], urls[1])]
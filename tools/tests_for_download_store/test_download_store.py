@@ -0,0 +1,91 @@
+import hashlib
+from collections import namedtuple
+
+from requests.structures import CaseInsensitiveDict
+
+from tools.download_store import DownloadStore, url_to_extension, conditional_headers, ETAG, LAST_MODIFIED, \
+    COMPLETE, URL
+
+FakeResponse = namedtuple('FakeResponse', 'status_code headers'.split())
+
+
+def _response(status_code, **headers):
+    headers = CaseInsensitiveDict({key.replace('_', '-'): value for key, value in headers.items()})
+    return FakeResponse(status_code, headers)
+
+
+def test_url_to_extension():
+    assert url_to_extension('https://nmr.cit.nih.gov/xplor-nih/packages/xplor-nih-3.4-db.tar.gz') == '.tar.gz'
+    assert url_to_extension('https://pypi.io/packages/source/n/nmrstarlib/nmrstarlib-2.1.1.zip') == '.zip'
+    assert url_to_extension('https://example.com/download/NMRPipeX') == ''
+
+
+def test_conditional_headers():
+    assert conditional_headers({}) == {}
+    assert conditional_headers({ETAG: '"abc"', LAST_MODIFIED: 'Tue, 01 Mar 2022 10:00:00 GMT'}) == {
+        'If-None-Match': '"abc"',
+        'If-Modified-Since': 'Tue, 01 Mar 2022 10:00:00 GMT'
+    }
+
+
+def test_request_headers_resume_partial(tmp_path):
+    store = DownloadStore(tmp_path)
+    entry = store.entry('https://example.com/test.tar.gz')
+
+    assert entry.request_headers() == {}
+
+    entry.meta = {URL: entry.url, ETAG: '"abc"'}
+    entry.path.mkdir(parents=True)
+    entry.part_path.write_bytes(b'0123456789')
+
+    assert entry.request_headers() == {'Range': 'bytes=10-', 'If-Range': '"abc"'}
+
+
+def test_commit_files_by_digest(tmp_path):
+    store = DownloadStore(tmp_path)
+    entry = store.entry('https://example.com/test.tar.gz')
+    entry.path.mkdir(parents=True)
+    entry.part_path.write_bytes(b'flibbertigibbet')
+
+    entry.commit({'sha256': 'ab12', 'md5': 'cd34'})
+
+    assert entry.is_complete()
+    assert entry.meta[COMPLETE]
+    assert store.digest_path('sha256', 'ab12', '.tar.gz') == tmp_path / '_source-cache' / 'archive' / 'ab' / \
+           'ab12.tar.gz'
+    assert store.digest_path('sha256', 'ab12', '.tar.gz').read_bytes() == b'flibbertigibbet'
+    assert store.digest_path('md5', 'cd34', '.tar.gz').read_bytes() == b'flibbertigibbet'
+
+    assert store.entry(entry.url).digests(['sha256']) == {'sha256': 'ab12'}
+    assert store.entry(entry.url).digests(['sha512']) is None
+
+
+def test_complete_entry_without_validators_is_reused_if_its_length_matches(tmp_path):
+    store = DownloadStore(tmp_path)
+    entry = store.entry('https://example.com/test.tar.gz')
+    entry.path.mkdir(parents=True)
+    entry.part_path.write_bytes(b'flibbertigibbet')
+    entry.commit({'sha256': 'ab12'})
+
+    assert entry.request_headers() == {}
+    assert entry.is_current(_response(200, content_length='15'))
+    assert not entry.is_current(_response(200, content_length='16'))
+    assert not entry.is_current(_response(200))
+    assert not entry.is_current(_response(200, content_length='15', etag='"abc"'))
+
+
+def test_only_a_range_continuing_the_part_file_is_appended(tmp_path):
+    store = DownloadStore(tmp_path)
+    entry = store.entry('https://example.com/test.tar.gz')
+    entry.path.mkdir(parents=True)
+    entry.part_path.write_bytes(b'0123456789')
+
+    assert entry.resumes_part(_response(206, content_range='bytes 10-19/20', etag='"abc"'))
+    assert not entry.resumes_part(_response(206, content_range='bytes 5-19/20', etag='"abc"'))
+    assert not entry.resumes_part(_response(206, etag='"abc"'))
+
+    file_handle, writer = entry.open_writer(_response(206, content_range='bytes 5-19/20', etag='"abc"'),
+                                            hashlib.sha256(), lambda path, digester: None)
+    with file_handle:
+        writer.update(b'56789')
+    assert entry.part_path.read_bytes() == b'56789'
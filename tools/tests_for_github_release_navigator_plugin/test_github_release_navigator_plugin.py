@@ -0,0 +1,18 @@
+import importlib
+from argparse import Namespace
+from pathlib import Path
+
+
+def test_navigator_cache_keeps_pages_not_seen_in_this_run(monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent))
+    plugin = importlib.import_module('checksum_plugins.github_release_navigator_plugin')
+
+    other_repository = 'https://api.github.com/repos/other/other/releases?per_page=100'
+    this_repository = 'https://api.github.com/repos/nmrpack/nmrpack/releases?per_page=100'
+
+    navigator = plugin.GithubReleaseNavigator(None, Namespace(jobs=1))
+    navigator.set_navigator_cache_data({other_repository: {'etag': '"a"'}, this_repository: {'etag': '"b"'}})
+    navigator._pages[this_repository] = {'etag': '"c"'}
+
+    assert navigator.get_navigator_cache_data() == {other_repository: {'etag': '"a"'},
+                                                    this_repository: {'etag': '"c"'}}
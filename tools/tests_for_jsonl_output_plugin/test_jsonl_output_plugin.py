@@ -0,0 +1,18 @@
+import json
+from pathlib import Path
+
+URL = 'https://example.org/xplor-nih-3.8.tar.gz'
+
+
+def test_errors_are_written_without_terminal_formatting(monkeypatch, capsys):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent))
+    from checksum_url import DownloadFailedException, get_failure_message
+    from checksum_plugins.jsonl_output_plugin import JsonLinesOutput
+    from checksum_plugins.ndjson_output_plugin import NdjsonOutput
+
+    error = DownloadFailedException(get_failure_message(URL, 'connection error'), 'connection refused')
+
+    for output_class in (JsonLinesOutput, NdjsonOutput):
+        output_class().on_error(URL, error, len(URL), 1)
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert records == [{'index': 1, 'url': URL, 'error': 'connection refused'}]
@@ -0,0 +1,73 @@
+import json
+import time
+from argparse import Namespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from threading import Thread
+
+import requests
+
+FILES_URL = 'https://files.pythonhosted.org/packages/source/n/nmrstarlib'
+OLD_URL = f'{FILES_URL}/nmrstarlib-2.1.0.tar.gz'
+NEW_URL = f'{FILES_URL}/nmrstarlib-2.1.1.tar.gz'
+SHORT_NEW_URL = 'https://pypi.io/packages/source/n/nmrstarlib/nmrstarlib-2.1.1.tar.gz'
+
+
+def _release(url, sha256):
+    return [{'url': url, 'digests': {'sha256': sha256}, 'size': 10}]
+
+
+INFO = {'name': 'nmrstarlib', 'summary': 'NMR-STAR parser', 'home_page': '', 'requires_dist': ['docopt']}
+OLD_JSON = {'info': INFO, 'releases': {'2.1.0': _release(OLD_URL, 'aa')}}
+NEW_JSON = {'info': INFO, 'releases': {'2.1.0': _release(OLD_URL, 'aa'), '2.1.1': _release(NEW_URL, 'bb')}}
+
+
+class PypiHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = json.dumps(NEW_JSON).encode()
+        self.send_response(200)
+        self.send_header('ETag', '"new"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_cached_json_missing_a_release_is_fetched_again(monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent))
+    from checksum_plugins.url_navigator_plugin import UrlNavigator
+    from checksum_plugins.pip_navigator_plugin import PipNavigator
+    from checksum_url import DIGESTS
+
+    server = ThreadingHTTPServer(('localhost', 0), PypiHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    info_url = f'http://localhost:{server.server_address[1]}/pypi/nmrstarlib/json'
+
+    try:
+        # the index lists a release published after the json was cached
+        monkeypatch.setattr(UrlNavigator, 'get_urls', lambda self, sorted_by_version=True: [OLD_URL, NEW_URL])
+
+        navigator = PipNavigator(requests.Session(), Namespace(version_regex=None, jobs=1))
+        navigator.set_navigator_cache_data({info_url: {'url': info_url, 'etag': '"old"', 'data': OLD_JSON,
+                                                       'fetched': time.time()}})
+        navigator._info_url = info_url
+        navigator._raw_extra_info = navigator._fetch_raw_extra_info()
+        assert PypiHandler.requests == []
+
+        assert SHORT_NEW_URL in navigator.get_urls()
+        assert PypiHandler.requests == ['/pypi/nmrstarlib/json']
+        assert navigator.get_extra_info(SHORT_NEW_URL)[DIGESTS] == {'sha256': 'bb'}
+        assert navigator.get_navigator_cache_data()[info_url]['data'] == NEW_JSON
+
+        # urls the json doesn't describe have no upstream information rather than raising
+        unknown_url = 'https://pypi.io/packages/source/n/nmrstarlib/nmrstarlib-9.9.9.tar.gz'
+        assert navigator.get_extra_info(unknown_url)[DIGESTS] == {}
+        assert navigator.get_upstream_digests(unknown_url) == {}
+        assert navigator.get_upstream_size(unknown_url) is None
+    finally:
+        server.shutdown()
@@ -0,0 +1,77 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from tools.plugins import discover_plugins, read_plugin_snapshot, PluginInfo, NAVIGATOR, OUTPUT
+
+PLUGIN_TEXT = '''
+from plugins import register_navigator, register_output
+
+
+@register_navigator()
+class TestNavigator:
+    NAME = 'test'
+
+
+@register_output()
+class TestOutput:
+    NAME = 'test'
+'''
+
+
+def test_plugin_snapshot_invalidated_by_plugin_changes(tmp_path):
+    plugins_directory = tmp_path / 'checksum_plugins'
+    plugins_directory.mkdir()
+    plugin_file = plugins_directory / 'test_plugin.py'
+    plugin_file.write_text(PLUGIN_TEXT)
+    (plugins_directory / 'helpers.py').write_text(PLUGIN_TEXT)
+
+    cache_file = tmp_path / 'cache' / 'plugins.json'
+
+    expected = [
+        PluginInfo('test', 'TestNavigator', NAVIGATOR, 'checksum_plugins.test_plugin', str(plugin_file)),
+        PluginInfo('test', 'TestOutput', OUTPUT, 'checksum_plugins.test_plugin', str(plugin_file))
+    ]
+    assert read_plugin_snapshot(cache_file, plugins_directory) is None
+    assert discover_plugins(cache_file, plugins_directory) == expected
+    assert read_plugin_snapshot(cache_file, plugins_directory) == expected
+
+    stat = plugin_file.stat()
+    plugin_file.write_text(PLUGIN_TEXT.replace("'test'", "'renamed'"))
+    os.utime(plugin_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert read_plugin_snapshot(cache_file, plugins_directory) is None
+    assert [plugin.name for plugin in discover_plugins(cache_file, plugins_directory)] == ['renamed', 'renamed']
+
+
+def _loaded_plugin_modules():
+    return {name for name in sys.modules if name.startswith('checksum_plugins.')}
+
+
+def test_plugin_modules_are_only_imported_when_used(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent))
+
+    # start from a fresh plugin registry with no plugin modules imported, the original modules are put back after
+    with patch.dict(sys.modules):
+        for name in list(sys.modules):
+            if name in ('plugins', 'checksum_url', 'checksum_plugins') or name.startswith('checksum_plugins.'):
+                del sys.modules[name]
+
+        plugins = importlib.import_module('plugins')
+        plugins.load_and_register_factory_classes()
+        assert _loaded_plugin_modules() == set()
+
+        assert 'url' in plugins.list_navigators().split(', ')
+        assert 'jsonl' in plugins.list_outputs().split(', ')
+        assert _loaded_plugin_modules() == set()
+
+        [navigator] = plugins.get_navigator(name='url')
+        assert navigator.NAME == 'url'
+        assert _loaded_plugin_modules() == {'checksum_plugins.url_navigator_plugin'}
+
+        assert plugins.get_output(name='jsonl').NAME == 'jsonl'
+        assert _loaded_plugin_modules() == {'checksum_plugins.url_navigator_plugin',
+                                            'checksum_plugins.jsonl_output_plugin'}
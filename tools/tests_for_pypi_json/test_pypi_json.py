@@ -0,0 +1,95 @@
+import argparse
+import json
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+import pytest
+
+from tools.pypi_json import PypiMetadata, positive_int, split_requirement
+
+PACKAGES = {
+    '/pypi/nmrstarlib/json': {'info': {'name': 'nmrstarlib', 'version': '2.1.1'}},
+    '/pypi/nmrstarlib/2.1.1/json': {'info': {'name': 'nmrstarlib', 'version': '2.1.1'}, 'urls': []},
+}
+
+
+class PypiHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        etag = f'"{hash(self.path)}"'
+        if self.path not in PACKAGES:
+            status = 404
+        elif self.headers.get('If-None-Match') == etag:
+            status = 304
+        else:
+            status = 200
+        self.requests.append((self.path, status))
+
+        body = json.dumps(PACKAGES[self.path]).encode() if status == 200 else b''
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_split_requirement():
+    assert split_requirement('nmrstarlib') == ('nmrstarlib', None)
+    assert split_requirement('nmrstarlib==2.1.1') == ('nmrstarlib', '2.1.1')
+
+
+def test_get_many_caches_and_revalidates(tmp_path):
+    server = ThreadingHTTPServer(('localhost', 0), PypiHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    pypi_url = f'http://localhost:{server.server_address[1]}/pypi'
+
+    try:
+        requirements = ['nmrstarlib', 'nmrstarlib==2.1.1', 'missing']
+
+        metadata = PypiMetadata(cache_directory=tmp_path, pypi_url=pypi_url, jobs=3)
+        result = metadata.get_many(requirements)
+        assert list(result) == requirements
+        assert result['nmrstarlib'] == PACKAGES['/pypi/nmrstarlib/json']
+        assert result['nmrstarlib==2.1.1'] == PACKAGES['/pypi/nmrstarlib/2.1.1/json']
+        assert result['missing'] is None
+        assert len(PypiHandler.requests) == 3
+
+        # fresh cached responses are used without a request
+        PypiHandler.requests.clear()
+        assert metadata.get('nmrstarlib') == PACKAGES['/pypi/nmrstarlib/json']
+        assert PypiHandler.requests == []
+
+        # stale ones are revalidated with their ETag
+        stale_metadata = PypiMetadata(cache_directory=tmp_path, pypi_url=pypi_url, ttl=0)
+        assert stale_metadata.get('nmrstarlib') == PACKAGES['/pypi/nmrstarlib/json']
+        assert PypiHandler.requests == [('/pypi/nmrstarlib/json', 304)]
+    finally:
+        server.shutdown()
+
+
+def test_damaged_cache_entries_are_refetched():
+    server = ThreadingHTTPServer(('localhost', 0), PypiHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    pypi_url = f'http://localhost:{server.server_address[1]}/pypi'
+
+    try:
+        url = f'{pypi_url}/nmrstarlib/json'
+        entries = {url: {'etag': '"stale"'}}
+
+        PypiHandler.requests.clear()
+        metadata = PypiMetadata(pypi_url=pypi_url, entries=entries)
+        assert metadata.get('nmrstarlib') == PACKAGES['/pypi/nmrstarlib/json']
+        assert PypiHandler.requests == [('/pypi/nmrstarlib/json', 200)]
+        assert entries[url]['data'] == PACKAGES['/pypi/nmrstarlib/json']
+    finally:
+        server.shutdown()
+
+
+def test_jobs_must_be_positive():
+    assert positive_int('2') == 2
+    with pytest.raises(argparse.ArgumentTypeError):
+        positive_int('0')
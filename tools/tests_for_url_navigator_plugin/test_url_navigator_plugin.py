@@ -0,0 +1,64 @@
+import importlib
+from pathlib import Path
+
+import pytest
+
+PAGE = '''<html><body>
+<a href="packages/xplor-nih-3.8.tar.gz">3.8</a>
+<a href="https://example.org/packages/xplor-nih-3.7.tar.gz">3.7</a>
+<a href="packages/README.txt">readme</a>
+<a href="packages/xplor-nih-3.8.tar.gz">3.8 again</a>
+<a name="no-href">nothing</a>
+<a href="packages/xplor-nih-3.6.zip">3.6</a>
+</body></html>
+'''
+
+EXPECTED = ['packages/xplor-nih-3.8.tar.gz', 'https://example.org/packages/xplor-nih-3.7.tar.gz',
+            'packages/xplor-nih-3.6.zip']
+
+
+@pytest.fixture
+def url_navigator(monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent))
+    return importlib.import_module('checksum_plugins.url_navigator_plugin')
+
+
+class FakePage:
+    """a response whose body is read in chunks of chunk_size bytes whatever size is asked for"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, text, chunk_size):
+        self._data = text.encode('utf-8')
+        self._chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._data), self._chunk_size):
+            yield self._data[start:start + self._chunk_size]
+
+
+def test_href_collector_keeps_first_appearance_order_once(url_navigator):
+    collector = url_navigator.HrefCollector(url_navigator.compile_templates(['xplor-nih-*']))
+    collector.feed(PAGE)
+    collector.close()
+
+    assert collector.hrefs == EXPECTED
+    assert collector.pop_new_hrefs() == EXPECTED
+    assert collector.pop_new_hrefs() == []
+
+
+def test_get_urls_for_templates_with_tags_split_between_chunks(url_navigator):
+    # chunks of 7 bytes split the tags and attribute values of every link
+    for chunk_size in (7, 64, len(PAGE)):
+        page = FakePage(PAGE, chunk_size)
+        assert url_navigator.get_urls_for_templates(page, ['*.tar.gz', '*.zip']) == EXPECTED
+
+
+def test_get_urls_for_templates_selects_by_file_name(url_navigator):
+    page = FakePage(PAGE, 64)
+    assert url_navigator.get_urls_for_templates(page, ['*.txt']) == ['packages/README.txt']
+
+
+def test_no_templates_match_nothing(url_navigator):
+    assert url_navigator.compile_templates([]).match('xplor-nih-3.8.tar.gz') is None
+    assert url_navigator.get_urls_for_templates(FakePage(PAGE, 64), []) == []